@@ -1,9 +1,60 @@
+"""Hypid package
+
+The submodules are imported on first attribute access, so that importing
+the package inside the CAD host is cheap.  The names exported by form are
+available on the package as before, e.g. hypid.make_line.
+"""
+
+import importlib
+import sys
+import types
+
+try:
+    reload
+except NameError:
+    from importlib import reload
+
+_submodules = ('euclid', 'form', 'transformations')
+
+
+class _LazyPackage(types.ModuleType):
+    # Python 2 has no module level __getattr__, so the package replaces
+    # itself in sys.modules with an instance of this class.
+
+    def __getattr__(self, name):
+        if name in _submodules:
+            value = importlib.import_module('.' + name, self.__name__)
+            if name in self._stale:
+                self._stale.discard(name)
+                value = reload(value)
+        elif name == '__all__':
+            value = list(self.form.__all__)
+        elif name.startswith('__') or name not in self.form.__all__:
+            raise AttributeError(name)
+        else:
+            value = getattr(self.form, name)
+        setattr(self, name, value)  # later lookups skip __getattr__
+        return value
+
+    def __dir__(self):
+        return sorted(set(self.__dict__) | set(_submodules))
 
-from form import *
 
-# reload dependencies when being reloaded
 try:
-    reload(form)
-    from form import *
-except ImportError:
-	pass
+    _stale
+except NameError:
+    # first import
+    _stale = set()
+    _package = _LazyPackage(__name__, __doc__)
+    _package.__dict__.update(globals())
+    _package._module = sys.modules[__name__]  # keeps these globals alive
+    sys.modules[__name__] = _package
+else:
+    # reload of the package: reload the submodules already in use on their
+    # next access, and forget the names taken from form
+    for _name in _submodules + tuple(getattr(globals().get('form'),
+                                             '__all__', ())):
+        if _name in globals():
+            if _name in _submodules:
+                _stale.add(_name)
+            del globals()[_name]
@@ -31,10 +31,18 @@ __docformat__ = 'restructuredtext'
 __version__ = '$Id$'
 __revision__ = '$Revision$'
 
+import heapq
+import inspect
 import math
 import operator
 import types
 
+# numpy is optional, only the array classes need it.
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 # Some magic here.  If _use_slots is True, the classes will derive from
 # object and will define a __slots__ class variable.  If _use_slots is
 # False, classes will be old-style and will not define __slots__.
@@ -833,13 +841,21 @@ class Matrix4:
                    self.i, self.j, self.k, self.l,
                    self.m, self.n, self.o, self.p)
 
+    # Attribute names in index (column-major) order
+    _columns = 'aeimbfjncgkodhlp'
+
     def __getitem__(self, key):
+        if isinstance(key, (int, long)):
+            return getattr(self, self._columns[key])
         return [self.a, self.e, self.i, self.m,
                 self.b, self.f, self.j, self.n,
                 self.c, self.g, self.k, self.o,
                 self.d, self.h, self.l, self.p][key]
 
     def __setitem__(self, key, value):
+        if isinstance(key, (int, long)):
+            setattr(self, self._columns[key], value)
+            return
         L = self[:]
         L[key] = value
         (self.a, self.e, self.i, self.m,
@@ -847,6 +863,37 @@ class Matrix4:
          self.c, self.g, self.k, self.o,
          self.d, self.h, self.l, self.p) = L
 
+    def tolist(self):
+        """Return the rows as nested lists, as Rhino and FreeCAD expect."""
+        return [[self.a, self.b, self.c, self.d],
+                [self.e, self.f, self.g, self.h],
+                [self.i, self.j, self.k, self.l],
+                [self.m, self.n, self.o, self.p]]
+
+    def to_numpy(self, order='C'):
+        """Return a 4x4 numpy array, M[row, column], as used by the
+        transformations module.  order gives the memory layout; with 'F'
+        the flat buffer is in the column-major order of self[:]."""
+        return numpy.array(self.tolist(), dtype=numpy.float64, order=order)
+
+    def __array__(self, dtype=None):
+        M = self.to_numpy()
+        if dtype is not None:
+            M = M.astype(dtype)
+        return M
+
+    @classmethod
+    def from_numpy(cls, array):
+        """Create from a 4x4 array indexed array[row, column], or from a
+        flat sequence of 16 values in row-major order."""
+        values = numpy.asarray(array, dtype=numpy.float64).ravel().tolist()
+        M = cls.__new__(cls)
+        (M.a, M.b, M.c, M.d,
+         M.e, M.f, M.g, M.h,
+         M.i, M.j, M.k, M.l,
+         M.m, M.n, M.o, M.p) = values
+        return M
+
     def __mul__(self, other):
         if isinstance(other, Matrix4):
             # Cache attributes in local vars (see Matrix3.__mul__).
@@ -988,6 +1035,43 @@ class Matrix4:
             P.z /= w
         return P
 
+    # Batch transforms of (N,3) arrays, see the Arrays section below.
+    # The result is written to out if given, which may be arr itself.
+    def transform_points(self, arr, out=None):
+        """Transform (N,3) points, translation applies."""
+        return self._transform_array(arr, out, True, False)
+
+    def transform_vectors(self, arr, out=None):
+        """Transform (N,3) vectors, translation is ignored."""
+        return self._transform_array(arr, out, False, False)
+
+    def transform_many(self, arr, out=None):
+        """Transform (N,3) points with homogeneous divide, like transform."""
+        return self._transform_array(arr, out, True, True)
+
+    def _transform_array(self, arr, out, translate, divide):
+        xyz = _as_xyz(arr).reshape(-1, 3)
+        if divide:
+            # before out is written, which may alias xyz
+            w = numpy.dot(xyz, (self.m, self.n, self.o)) + self.p
+        L = self.to_numpy()[:3, :3].T
+        if out is None:
+            result = numpy.dot(xyz, L)
+        else:
+            result = _as_xyz(out)
+            if numpy.may_share_memory(result, xyz):
+                result[:] = numpy.dot(xyz, L)
+            else:
+                numpy.dot(xyz, L, out=result)
+        if translate:
+            result += (self.d, self.h, self.l)
+        if divide:
+            w[w == 0] = 1.0
+            result /= w[:, numpy.newaxis]
+        if isinstance(arr, Vector3Array):
+            return arr.__class__(result, copy=False)
+        return result
+
     def identity(self):
         self.a = self.f = self.k = self.p = 1.
         self.b = self.c = self.d = self.e = self.g = self.h = \
@@ -1026,6 +1110,19 @@ class Matrix4:
         self *= Matrix4.new_rotate_triple_axis(x, y, z)
         return self
 
+    def pivot(self, center):
+        """Make the transform act about center instead of the origin.
+
+        Same as new_translate(c) * self * new_translate(-c), but computed
+        in place without building and multiplying the extra matrices.
+        Only valid for affine matrices (bottom row 0, 0, 0, 1).
+        """
+        cx, cy, cz = center
+        self.d += cx - (self.a * cx + self.b * cy + self.c * cz)
+        self.h += cy - (self.e * cx + self.f * cy + self.g * cz)
+        self.l += cz - (self.i * cx + self.j * cy + self.k * cz)
+        return self
+
     def transpose(self):
         (self.a, self.e, self.i, self.m,
          self.b, self.f, self.j, self.n,
@@ -1180,6 +1277,37 @@ class Matrix4:
         return self
     new_perspective = classmethod(new_perspective)
 
+    # Pivoted constructors, e.g. a rotation about a point other than the
+    # origin, written in one pass (see pivot).
+    def new_scale_about(cls, x, y, z, center):
+        self = cls.new_scale(x, y, z)
+        cx, cy, cz = center
+        self.d = cx * (1 - x)
+        self.h = cy * (1 - y)
+        self.l = cz * (1 - z)
+        return self
+    new_scale_about = classmethod(new_scale_about)
+
+    def new_rotatex_about(cls, angle, center):
+        return cls.new_rotatex(angle).pivot(center)
+    new_rotatex_about = classmethod(new_rotatex_about)
+
+    def new_rotatey_about(cls, angle, center):
+        return cls.new_rotatey(angle).pivot(center)
+    new_rotatey_about = classmethod(new_rotatey_about)
+
+    def new_rotatez_about(cls, angle, center):
+        return cls.new_rotatez(angle).pivot(center)
+    new_rotatez_about = classmethod(new_rotatez_about)
+
+    def new_rotate_axis_about(cls, angle, axis, center):
+        return cls.new_rotate_axis(angle, axis).pivot(center)
+    new_rotate_axis_about = classmethod(new_rotate_axis_about)
+
+    def new_rotate_euler_about(cls, heading, attitude, bank, center):
+        return cls.new_rotate_euler(heading, attitude, bank).pivot(center)
+    new_rotate_euler_about = classmethod(new_rotate_euler_about)
+
     def determinant(self):
         return ((self.a * self.f - self.e * self.b)
               * (self.k * self.p - self.o * self.l)
@@ -1599,35 +1727,27 @@ class Quaternion:
 # ---------------------------------------------------------------------------
 
 class Geometry:
-    def _connect_unimplemented(self, other):
-        raise AttributeError, 'Cannot connect %s to %s' % \
-            (self.__class__, other.__class__)
-
-    def _intersect_unimplemented(self, other):
-        raise AttributeError, 'Cannot intersect %s and %s' % \
-            (self.__class__, other.__class__)
-
-    _intersect_point2 = _intersect_unimplemented
-    _intersect_line2 = _intersect_unimplemented
-    _intersect_circle = _intersect_unimplemented
-    _connect_point2 = _connect_unimplemented
-    _connect_line2 = _connect_unimplemented
-    _connect_circle = _connect_unimplemented
-
-    _intersect_point3 = _intersect_unimplemented
-    _intersect_line3 = _intersect_unimplemented
-    _intersect_sphere = _intersect_unimplemented
-    _intersect_plane = _intersect_unimplemented
-    _connect_point3 = _connect_unimplemented
-    _connect_line3 = _connect_unimplemented
-    _connect_sphere = _connect_unimplemented
-    _connect_plane = _connect_unimplemented
-
+    # intersect and connect look up a kernel for the pair of classes in
+    # _intersect_kernels and _connect_kernels (see register_intersect and
+    # register_connect below), so adding a primitive means adding table
+    # entries rather than a method to every other class.
     def intersect(self, other):
-        raise NotImplementedError
+        try:
+            kernel = _intersect_cache[self.__class__, other.__class__]
+        except KeyError:
+            kernel = _resolve(_intersect_kernels, _intersect_cache,
+                              self.__class__, other.__class__,
+                              _intersect_unimplemented)
+        return kernel(self, other)
 
     def connect(self, other):
-        raise NotImplementedError
+        try:
+            kernel = _connect_cache[self.__class__, other.__class__]
+        except KeyError:
+            kernel = _resolve(_connect_kernels, _connect_cache,
+                              self.__class__, other.__class__,
+                              _connect_unimplemented)
+        return kernel(self, other)
 
     def distance(self, other):
         c = self.connect(other)
@@ -1637,7 +1757,10 @@ class Geometry:
 
 def _intersect_point2_circle(P, C):
     return abs(P - C.c) <= C.r
-    
+
+def _intersect_circle_point2(C, P):
+    return abs(P - C.c) <= C.r
+
 def _intersect_line2_line2(A, B):
     d = B.v.y * A.v.x - B.v.x * A.v.y
     if d == 0:
@@ -1688,6 +1811,9 @@ def _intersect_line2_circle(L, C):
                         Point2(L.p.x + u2 * L.v.x,
                                L.p.y + u2 * L.v.y))
 
+def _intersect_circle_line2(C, L):
+    return _intersect_line2_circle(L, C)
+
 def _intersect_circle_circle(A, B):
     d = abs(A.c - B.c)
     s = A.r + B.r
@@ -1719,12 +1845,29 @@ def _connect_point2_line2(P, L):
                         Point2(L.p.x + u * L.v.x,
                                L.p.y + u * L.v.y))
 
+def _connect_line2_point2(L, P):
+    d = L.v.magnitude_squared()
+    assert d != 0
+    u = ((P.x - L.p.x) * L.v.x + \
+         (P.y - L.p.y) * L.v.y) / d
+    if not L._u_in(u):
+        u = max(min(u, 1.0), 0.0)
+    return LineSegment2(Point2(L.p.x + u * L.v.x,
+                               L.p.y + u * L.v.y),
+                        P)
+
 def _connect_point2_circle(P, C):
     v = P - C.c
     v.normalize()
     v *= C.r
     return LineSegment2(P, Point2(C.c.x + v.x, C.c.y + v.y))
 
+def _connect_circle_point2(C, P):
+    v = P - C.c
+    v.normalize()
+    v *= C.r
+    return LineSegment2(Point2(C.c.x + v.x, C.c.y + v.y), P)
+
 def _connect_line2_line2(A, B):
     d = B.v.y * A.v.x - B.v.x * A.v.y
     if d == 0:
@@ -1760,6 +1903,18 @@ def _connect_circle_line2(C, L):
     v *= C.r
     return LineSegment2(Point2(C.c.x + v.x, C.c.y + v.y), point)
 
+def _connect_line2_circle(L, C):
+    d = L.v.magnitude_squared()
+    assert d != 0
+    u = ((C.c.x - L.p.x) * L.v.x + (C.c.y - L.p.y) * L.v.y) / d
+    if not L._u_in(u):
+        u = max(min(u, 1.0), 0.0)
+    point = Point2(L.p.x + u * L.v.x, L.p.y + u * L.v.y)
+    v = (point - C.c)
+    v.normalize()
+    v *= C.r
+    return LineSegment2(point, Point2(C.c.x + v.x, C.c.y + v.y))
+
 def _connect_circle_circle(A, B):
     v = B.c - A.c
     d = v.magnitude()
@@ -1780,28 +1935,6 @@ class Point2(Vector2, Geometry):
     def __repr__(self):
         return 'Point2(%.2f, %.2f)' % (self.x, self.y)
 
-    def intersect(self, other):
-        return other._intersect_point2(self)
-
-    def _intersect_circle(self, other):
-        return _intersect_point2_circle(self, other)
-
-    def connect(self, other):
-        return other._connect_point2(self)
-
-    def _connect_point2(self, other):
-        return LineSegment2(other, self)
-    
-    def _connect_line2(self, other):
-        c = _connect_point2_line2(self, other)
-        if c:
-            return c._swap()
-
-    def _connect_circle(self, other):
-        c = _connect_point2_circle(self, other)
-        if c:
-            return c._swap()
-
 class Line2(Geometry):
     __slots__ = ['p', 'v']
 
@@ -1853,27 +1986,6 @@ class Line2(Geometry):
     def _u_in(self, u):
         return True
 
-    def intersect(self, other):
-        return other._intersect_line2(self)
-
-    def _intersect_line2(self, other):
-        return _intersect_line2_line2(self, other)
-
-    def _intersect_circle(self, other):
-        return _intersect_line2_circle(self, other)
-
-    def connect(self, other):
-        return other._connect_line2(self)
-
-    def _connect_point2(self, other):
-        return _connect_point2_line2(other, self)
-
-    def _connect_line2(self, other):
-        return _connect_line2_line2(other, self)
-
-    def _connect_circle(self, other):
-        return _connect_circle_line2(other, self)
-
 class Ray2(Line2):
     def __repr__(self):
         return 'Ray2(<%.2f, %.2f> + u<%.2f, %.2f>)' % \
@@ -1924,32 +2036,6 @@ class Circle(Geometry):
     def _apply_transform(self, t):
         self.c = t * self.c
 
-    def intersect(self, other):
-        return other._intersect_circle(self)
-
-    def _intersect_point2(self, other):
-        return _intersect_point2_circle(other, self)
-
-    def _intersect_line2(self, other):
-        return _intersect_line2_circle(other, self)
-
-    def _intersect_circle(self, other):
-        return _intersect_circle_circle(other, self)
-
-    def connect(self, other):
-        return other._connect_circle(self)
-
-    def _connect_point2(self, other):
-        return _connect_point2_circle(other, self)
-
-    def _connect_line2(self, other):
-        c = _connect_circle_line2(self, other)
-        if c:
-            return c._swap()
-
-    def _connect_circle(self, other):
-        return _connect_circle_circle(other, self)
-
     def tangent_points(self, p):
         m = 0.5 * (self.c + p)
         return self.intersect(Circle(m, abs(p - m)))
@@ -1969,17 +2055,40 @@ def _connect_point3_line3(P, L):
                                   L.p.y + u * L.v.y,
                                   L.p.z + u * L.v.z))
 
+def _connect_line3_point3(L, P):
+    d = L.v.magnitude_squared()
+    assert d != 0
+    u = ((P.x - L.p.x) * L.v.x + \
+         (P.y - L.p.y) * L.v.y + \
+         (P.z - L.p.z) * L.v.z) / d
+    if not L._u_in(u):
+        u = max(min(u, 1.0), 0.0)
+    return LineSegment3(Point3(L.p.x + u * L.v.x,
+                               L.p.y + u * L.v.y,
+                               L.p.z + u * L.v.z), P)
+
 def _connect_point3_sphere(P, S):
     v = P - S.c
     v.normalize()
     v *= S.r
     return LineSegment3(P, Point3(S.c.x + v.x, S.c.y + v.y, S.c.z + v.z))
 
+def _connect_sphere_point3(S, P):
+    v = P - S.c
+    v.normalize()
+    v *= S.r
+    return LineSegment3(Point3(S.c.x + v.x, S.c.y + v.y, S.c.z + v.z), P)
+
 def _connect_point3_plane(p, plane):
     n = plane.n.normalized()
     d = p.dot(plane.n) - plane.k
     return LineSegment3(p, Point3(p.x - n.x * d, p.y - n.y * d, p.z - n.z * d))
 
+def _connect_plane_point3(plane, p):
+    n = plane.n.normalized()
+    d = p.dot(plane.n) - plane.k
+    return LineSegment3(Point3(p.x - n.x * d, p.y - n.y * d, p.z - n.z * d), p)
+
 def _connect_line3_line3(A, B):
     assert A.v and B.v
     p13 = A.p - B.p
@@ -1989,12 +2098,21 @@ def _connect_line3_line3(A, B):
     d4343 = B.v.magnitude_squared()
     denom = A.v.magnitude_squared() * d4343 - d4321 ** 2
     if denom == 0:
-        # Parallel, connect an endpoint with a line
+        # Parallel, the shortest connection starts or ends at one of the
+        # endpoints, so try them all
+        candidates = []
+        if isinstance(A, Ray3) or isinstance(A, LineSegment3):
+            candidates.append(_connect_point3_line3(A.p, B))
+            if isinstance(A, LineSegment3):
+                candidates.append(_connect_point3_line3(A.p2, B))
         if isinstance(B, Ray3) or isinstance(B, LineSegment3):
-            return _connect_point3_line3(B.p, A)._swap()
-        # No endpoint (or endpoint is on A), possibly choose arbitrary
-        # point on line.
-        return _connect_point3_line3(A.p, B)
+            candidates.append(_connect_line3_point3(A, B.p))
+            if isinstance(B, LineSegment3):
+                candidates.append(_connect_line3_point3(A, B.p2))
+        if not candidates:
+            # Two infinite lines, any point will do
+            return _connect_point3_line3(A.p, B)
+        return min(candidates, key=lambda L: L.v.magnitude_squared())
 
     ua = (d1343 * d4321 - d1321 * d4343) / denom
     if not A._u_in(ua):
@@ -2002,6 +2120,10 @@ def _connect_line3_line3(A, B):
     ub = (d1343 + d4321 * ua) / d4343
     if not B._u_in(ub):
         ub = max(min(ub, 1.0), 0.0)
+        # closest point on A to the clamped end of B
+        ua = (d4321 * ub - d1321) / A.v.magnitude_squared()
+        if not A._u_in(ua):
+            ua = max(min(ua, 1.0), 0.0)
     return LineSegment3(Point3(A.p.x + ua * A.v.x,
                                A.p.y + ua * A.v.y,
                                A.p.z + ua * A.v.z),
@@ -2024,6 +2146,10 @@ def _connect_line3_plane(L, P):
     # Intersection
     return None
 
+def _connect_plane_line3(P, L):
+    # from the line to the plane, like Plane.connect always did
+    return _connect_line3_plane(L, P)
+
 def _connect_sphere_line3(S, L):
     d = L.v.magnitude_squared()
     assert d != 0
@@ -2039,6 +2165,21 @@ def _connect_sphere_line3(S, L):
     return LineSegment3(Point3(S.c.x + v.x, S.c.y + v.y, S.c.z + v.z), 
                         point)
 
+def _connect_line3_sphere(L, S):
+    d = L.v.magnitude_squared()
+    assert d != 0
+    u = ((S.c.x - L.p.x) * L.v.x + \
+         (S.c.y - L.p.y) * L.v.y + \
+         (S.c.z - L.p.z) * L.v.z) / d
+    if not L._u_in(u):
+        u = max(min(u, 1.0), 0.0)
+    point = Point3(L.p.x + u * L.v.x, L.p.y + u * L.v.y, L.p.z + u * L.v.z)
+    v = (point - S.c)
+    v.normalize()
+    v *= S.r
+    return LineSegment3(point,
+                        Point3(S.c.x + v.x, S.c.y + v.y, S.c.z + v.z))
+
 def _connect_sphere_sphere(A, B):
     v = B.c - A.c
     d = v.magnitude()
@@ -2070,6 +2211,10 @@ def _connect_sphere_plane(S, P):
     return LineSegment3(Point3(S.c.x + v.x, S.c.y + v.y, S.c.z + v.z), 
                         p2)
 
+def _connect_plane_sphere(P, S):
+    # from the sphere to the plane, like Plane.connect always did
+    return _connect_sphere_plane(S, P)
+
 def _connect_plane_plane(A, B):
     if A.n.cross(B.n):
         # Planes intersect
@@ -2080,7 +2225,10 @@ def _connect_plane_plane(A, B):
 
 def _intersect_point3_sphere(P, S):
     return abs(P - S.c) <= S.r
-    
+
+def _intersect_sphere_point3(S, P):
+    return abs(P - S.c) <= S.r
+
 def _intersect_line3_sphere(L, S):
     a = L.v.magnitude_squared()
     b = 2 * (L.v.x * (L.p.x - S.c.x) + \
@@ -2107,6 +2255,9 @@ def _intersect_line3_sphere(L, S):
                                L.p.y + u2 * L.v.y,
                                L.p.z + u2 * L.v.z))
 
+def _intersect_sphere_line3(S, L):
+    return _intersect_line3_sphere(L, S)
+
 def _intersect_line3_plane(L, P):
     d = P.n.dot(L.v)
     if not d:
@@ -2119,6 +2270,9 @@ def _intersect_line3_plane(L, P):
                   L.p.y + u * L.v.y,
                   L.p.z + u * L.v.z)
 
+def _intersect_plane_line3(P, L):
+    return _intersect_line3_plane(L, P)
+
 def _intersect_plane_plane(A, B):
     n1_m = A.n.magnitude_squared()
     n2_m = B.n.magnitude_squared()
@@ -2132,42 +2286,149 @@ def _intersect_plane_plane(A, B):
     return Line3(Point3(c1 * A.n.x + c2 * B.n.x,
                         c1 * A.n.y + c2 * B.n.y,
                         c1 * A.n.z + c2 * B.n.z), 
-                 A.n.cross(B.n))
-
-class Point3(Vector3, Geometry):
-    def __repr__(self):
-        return 'Point3(%.2f, %.2f, %.2f)' % (self.x, self.y, self.z)
+                 B.n.cross(A.n))
+
+def _intersect_point3_aabb3(P, B):
+    return B.min.x <= P.x <= B.max.x and \
+           B.min.y <= P.y <= B.max.y and \
+           B.min.z <= P.z <= B.max.z
+
+def _intersect_aabb3_point3(B, P):
+    return B.min.x <= P.x <= B.max.x and \
+           B.min.y <= P.y <= B.max.y and \
+           B.min.z <= P.z <= B.max.z
+
+def _intersect_line3_aabb3(L, B):
+    # slab test, clipping the parameter range of L to each pair of faces
+    inf = float('inf')
+    if isinstance(L, LineSegment3):
+        u0, u1 = 0.0, 1.0
+    elif isinstance(L, Ray3):
+        u0, u1 = 0.0, inf
+    else:
+        u0, u1 = -inf, inf
+    for p, v, lo, hi in ((L.p.x, L.v.x, B.min.x, B.max.x),
+                         (L.p.y, L.v.y, B.min.y, B.max.y),
+                         (L.p.z, L.v.z, B.min.z, B.max.z)):
+        if v == 0:
+            if p < lo or p > hi:
+                return None
+            continue
+        a = (lo - p) / v
+        b = (hi - p) / v
+        if a > b:
+            a, b = b, a
+        u0 = max(u0, a)
+        u1 = min(u1, b)
+        if u0 > u1:
+            return None
+    return LineSegment3(Point3(L.p.x + u0 * L.v.x,
+                               L.p.y + u0 * L.v.y,
+                               L.p.z + u0 * L.v.z),
+                        Point3(L.p.x + u1 * L.v.x,
+                               L.p.y + u1 * L.v.y,
+                               L.p.z + u1 * L.v.z))
 
-    def intersect(self, other):
-        return other._intersect_point3(self)
+def _intersect_aabb3_line3(B, L):
+    return _intersect_line3_aabb3(L, B)
 
-    def _intersect_sphere(self, other):
-        return _intersect_point3_sphere(self, other)
+def _intersect_sphere_aabb3(S, B):
+    return abs(_closest_point3_aabb3(S.c, B) - S.c) <= S.r
 
-    def connect(self, other):
-        return other._connect_point3(self)
+def _intersect_aabb3_sphere(B, S):
+    return abs(_closest_point3_aabb3(S.c, B) - S.c) <= S.r
 
-    def _connect_point3(self, other):
-        if self != other:
-            return LineSegment3(other, self)
+def _intersect_aabb3_aabb3(A, B):
+    lo = Point3(max(A.min.x, B.min.x), max(A.min.y, B.min.y),
+                max(A.min.z, B.min.z))
+    hi = Point3(min(A.max.x, B.max.x), min(A.max.y, B.max.y),
+                min(A.max.z, B.max.z))
+    if lo.x > hi.x or lo.y > hi.y or lo.z > hi.z:
+        return None
+    return AABB3(lo, hi)
+
+def _intersect_line3_triangle3(L, T):
+    # Moller-Trumbore: solve p + u v = p1 + a e1 + b e2
+    e1 = T.p2 - T.p1
+    e2 = T.p3 - T.p1
+    h = L.v.cross(e2)
+    d = e1.dot(h)
+    if not d:
+        # Parallel
+        return None
+    s = L.p - T.p1
+    a = s.dot(h) / d
+    if a < 0.0 or a > 1.0:
+        return None
+    q = s.cross(e1)
+    b = L.v.dot(q) / d
+    if b < 0.0 or a + b > 1.0:
         return None
+    u = e2.dot(q) / d
+    if not L._u_in(u):
+        return None
+    return Point3(L.p.x + u * L.v.x,
+                  L.p.y + u * L.v.y,
+                  L.p.z + u * L.v.z)
 
-    def _connect_line3(self, other):
-        c = _connect_point3_line3(self, other)
-        if c:
-            return c._swap()
-        
-    def _connect_sphere(self, other):
-        c = _connect_point3_sphere(self, other)
-        if c:
-            return c._swap()
+def _intersect_triangle3_line3(T, L):
+    return _intersect_line3_triangle3(L, T)
+
+def _closest_point3_aabb3(P, B):
+    return Point3(max(B.min.x, min(P.x, B.max.x)),
+                  max(B.min.y, min(P.y, B.max.y)),
+                  max(B.min.z, min(P.z, B.max.z)))
+
+def _closest_point3_triangle3(P, T):
+    # Ericson, Real-Time Collision Detection, 5.1.5: find the Voronoi
+    # region of P among the vertices, edges and face of T
+    a, b, c = T.p1, T.p2, T.p3
+    ab = b - a
+    ac = c - a
+    ap = P - a
+    d1 = ab.dot(ap)
+    d2 = ac.dot(ap)
+    if d1 <= 0 and d2 <= 0:
+        return a.copy()
+    bp = P - b
+    d3 = ab.dot(bp)
+    d4 = ac.dot(bp)
+    if d3 >= 0 and d4 <= d3:
+        return b.copy()
+    vc = d1 * d4 - d3 * d2
+    if vc <= 0 and d1 >= 0 and d3 <= 0:
+        return a + ab * (d1 / (d1 - d3))
+    cp = P - c
+    d5 = ab.dot(cp)
+    d6 = ac.dot(cp)
+    if d6 >= 0 and d5 <= d6:
+        return c.copy()
+    vb = d5 * d2 - d1 * d6
+    if vb <= 0 and d2 >= 0 and d6 <= 0:
+        return a + ac * (d2 / (d2 - d6))
+    va = d3 * d6 - d5 * d4
+    if va <= 0 and d4 - d3 >= 0 and d5 - d6 >= 0:
+        return b + (c - b) * ((d4 - d3) / ((d4 - d3) + (d5 - d6)))
+    denom = va + vb + vc
+    return a + ab * (vb / denom) + ac * (vc / denom)
+
+def _connect_point3_aabb3(P, B):
+    return LineSegment3(P, _closest_point3_aabb3(P, B))
+
+def _connect_aabb3_point3(B, P):
+    return LineSegment3(_closest_point3_aabb3(P, B), P)
+
+def _connect_point3_triangle3(P, T):
+    return LineSegment3(P, _closest_point3_triangle3(P, T))
+
+def _connect_triangle3_point3(T, P):
+    return LineSegment3(_closest_point3_triangle3(P, T), P)
 
-    def _connect_plane(self, other):
-        c = _connect_point3_plane(self, other)
-        if c:
-            return c._swap()
+class Point3(Vector3, Geometry):
+    def __repr__(self):
+        return 'Point3(%.2f, %.2f, %.2f)' % (self.x, self.y, self.z)
 
-class Line3:
+class Line3(Geometry):
     __slots__ = ['p', 'v']
 
     def __init__(self, *args):
@@ -2220,32 +2481,6 @@ class Line3:
     def _u_in(self, u):
         return True
 
-    def intersect(self, other):
-        return other._intersect_line3(self)
-
-    def _intersect_sphere(self, other):
-        return _intersect_line3_sphere(self, other)
-
-    def _intersect_plane(self, other):
-        return _intersect_line3_plane(self, other)
-
-    def connect(self, other):
-        return other._connect_line3(self)
-
-    def _connect_point3(self, other):
-        return _connect_point3_line3(other, self)
-
-    def _connect_line3(self, other):
-        return _connect_line3_line3(other, self)
-
-    def _connect_sphere(self, other):
-        return _connect_sphere_line3(other, self)
-
-    def _connect_plane(self, other):
-        c = _connect_line3_plane(self, other)
-        if c:
-            return c
-
 class Ray3(Line3):
     def __repr__(self):
         return 'Ray3(<%.2f, %.2f, %.2f> + u<%.2f, %.2f, %.2f>)' % \
@@ -2277,7 +2512,7 @@ class LineSegment3(Line3):
 
     length = property(lambda self: abs(self.v))
 
-class Sphere:
+class Sphere(Geometry):
     __slots__ = ['c', 'r']
 
     def __init__(self, center, radius):
@@ -2297,35 +2532,7 @@ class Sphere:
     def _apply_transform(self, t):
         self.c = t * self.c
 
-    def intersect(self, other):
-        return other._intersect_sphere(self)
-
-    def _intersect_point3(self, other):
-        return _intersect_point3_sphere(other, self)
-
-    def _intersect_line3(self, other):
-        return _intersect_line3_sphere(other, self)
-
-    def connect(self, other):
-        return other._connect_sphere(self)
-
-    def _connect_point3(self, other):
-        return _connect_point3_sphere(other, self)
-
-    def _connect_line3(self, other):
-        c = _connect_sphere_line3(self, other)
-        if c:
-            return c._swap()
-
-    def _connect_sphere(self, other):
-        return _connect_sphere_sphere(other, self)
-
-    def _connect_plane(self, other):
-        c = _connect_sphere_plane(self, other)
-        if c:
-            return c
-
-class Plane:
+class Plane(Geometry):
     # n.p = k, where n is normal, p is point on plane, k is constant scalar
     __slots__ = ['n', 'k']
 
@@ -2376,27 +2583,1120 @@ class Plane:
         self.n = t * self.n
         self.k = self.n.dot(p)
 
-    def intersect(self, other):
-        return other._intersect_plane(self)
+class AABB3(Geometry):
+    # axis aligned box between corners min and max
+    __slots__ = ['min', 'max']
 
-    def _intersect_line3(self, other):
-        return _intersect_line3_plane(other, self)
+    def __init__(self, *args):
+        if len(args) == 2:
+            assert isinstance(args[0], Vector3) and \
+                   isinstance(args[1], Vector3)
+            a, b = args
+        elif len(args) == 1 and isinstance(args[0], AABB3):
+            a, b = args[0].min, args[0].max
+        else:
+            raise AttributeError, '%r' % (args,)
+        self.min = Point3(min(a.x, b.x), min(a.y, b.y), min(a.z, b.z))
+        self.max = Point3(max(a.x, b.x), max(a.y, b.y), max(a.z, b.z))
 
-    def _intersect_plane(self, other):
-        return _intersect_plane_plane(self, other)
+    def __copy__(self):
+        return self.__class__(self.min, self.max)
 
-    def connect(self, other):
-        return other._connect_plane(self)
+    copy = __copy__
 
-    def _connect_point3(self, other):
-        return _connect_point3_plane(other, self)
+    def __repr__(self):
+        return 'AABB3(<%.2f, %.2f, %.2f> to <%.2f, %.2f, %.2f>)' % \
+            (self.min.x, self.min.y, self.min.z,
+             self.max.x, self.max.y, self.max.z)
 
-    def _connect_line3(self, other):
-        return _connect_line3_plane(other, self)
+    def _apply_transform(self, t):
+        # the box around the transformed corners
+        corners = [t * Point3(x, y, z)
+                   for x in (self.min.x, self.max.x)
+                   for y in (self.min.y, self.max.y)
+                   for z in (self.min.z, self.max.z)]
+        self.min = Point3(min([c.x for c in corners]),
+                          min([c.y for c in corners]),
+                          min([c.z for c in corners]))
+        self.max = Point3(max([c.x for c in corners]),
+                          max([c.y for c in corners]),
+                          max([c.z for c in corners]))
+
+    center = property(lambda self: Point3((self.min.x + self.max.x) * 0.5,
+                                          (self.min.y + self.max.y) * 0.5,
+                                          (self.min.z + self.max.z) * 0.5))
+    size = property(lambda self: self.max - self.min)
+
+class Triangle3(Geometry):
+    __slots__ = ['p1', 'p2', 'p3']
+
+    def __init__(self, p1, p2, p3):
+        assert isinstance(p1, Point3) and \
+               isinstance(p2, Point3) and \
+               isinstance(p3, Point3)
+        self.p1 = p1.copy()
+        self.p2 = p2.copy()
+        self.p3 = p3.copy()
+
+    def __copy__(self):
+        return self.__class__(self.p1, self.p2, self.p3)
+
+    copy = __copy__
+
+    def __repr__(self):
+        return 'Triangle3(<%.2f, %.2f, %.2f>, <%.2f, %.2f, %.2f>, ' \
+               '<%.2f, %.2f, %.2f>)' % \
+            (self.p1.x, self.p1.y, self.p1.z,
+             self.p2.x, self.p2.y, self.p2.z,
+             self.p3.x, self.p3.y, self.p3.z)
+
+    def _apply_transform(self, t):
+        self.p1 = t * self.p1
+        self.p2 = t * self.p2
+        self.p3 = t * self.p3
+
+    def _get_normal(self):
+        return (self.p2 - self.p1).cross(self.p3 - self.p1).normalize()
+    normal = property(_get_normal)
+
+    area = property(lambda self:
+                    abs((self.p2 - self.p1).cross(self.p3 - self.p1)) * 0.5)
+
+# Dispatch
+# Kernels for Geometry.intersect and Geometry.connect, keyed by the pair of
+# classes.  A pair with no entry of its own uses the nearest entry up the
+# base classes of both arguments, resolved once and cached per pair.
+# ---------------------------------------------------------------------------
+
+def _swapped(c):
+    if c:
+        return c._swap()
+
+def _connect_point2_point2(A, B):
+    return LineSegment2(A, B)
+
+def _connect_point3_point3(A, B):
+    if A != B:
+        return LineSegment3(A, B)
+    return None
+
+_intersect_kernels = {
+    (Point2, Circle): _intersect_point2_circle,
+    (Line2, Line2): _intersect_line2_line2,
+    (Line2, Circle): _intersect_line2_circle,
+    (Circle, Point2): _intersect_circle_point2,
+    (Circle, Line2): _intersect_circle_line2,
+    (Circle, Circle): _intersect_circle_circle,
+
+    (Point3, Sphere): _intersect_point3_sphere,
+    (Line3, Sphere): _intersect_line3_sphere,
+    (Line3, Plane): _intersect_line3_plane,
+    (Sphere, Point3): _intersect_sphere_point3,
+    (Sphere, Line3): _intersect_sphere_line3,
+    (Plane, Line3): _intersect_plane_line3,
+    (Plane, Plane): _intersect_plane_plane,
+
+    (Point3, AABB3): _intersect_point3_aabb3,
+    (Line3, AABB3): _intersect_line3_aabb3,
+    (Sphere, AABB3): _intersect_sphere_aabb3,
+    (AABB3, Point3): _intersect_aabb3_point3,
+    (AABB3, Line3): _intersect_aabb3_line3,
+    (AABB3, Sphere): _intersect_aabb3_sphere,
+    (AABB3, AABB3): _intersect_aabb3_aabb3,
+    (Line3, Triangle3): _intersect_line3_triangle3,
+    (Triangle3, Line3): _intersect_triangle3_line3,
+}
+
+_connect_kernels = {
+    (Point2, Point2): _connect_point2_point2,
+    (Point2, Line2): _connect_point2_line2,
+    (Point2, Circle): _connect_point2_circle,
+    (Line2, Point2): _connect_line2_point2,
+    (Line2, Line2): _connect_line2_line2,
+    (Line2, Circle): _connect_line2_circle,
+    (Circle, Point2): _connect_circle_point2,
+    (Circle, Line2): _connect_circle_line2,
+    (Circle, Circle): _connect_circle_circle,
+
+    (Point3, Point3): _connect_point3_point3,
+    (Point3, Line3): _connect_point3_line3,
+    (Point3, Sphere): _connect_point3_sphere,
+    (Point3, Plane): _connect_point3_plane,
+    (Line3, Point3): _connect_line3_point3,
+    (Line3, Line3): _connect_line3_line3,
+    (Line3, Sphere): _connect_line3_sphere,
+    (Line3, Plane): _connect_line3_plane,
+    (Sphere, Point3): _connect_sphere_point3,
+    (Sphere, Line3): _connect_sphere_line3,
+    (Sphere, Sphere): _connect_sphere_sphere,
+    (Sphere, Plane): _connect_sphere_plane,
+    (Plane, Point3): _connect_plane_point3,
+    (Plane, Line3): _connect_plane_line3,
+    (Plane, Sphere): _connect_plane_sphere,
+    (Plane, Plane): _connect_plane_plane,
+
+    (Point3, AABB3): _connect_point3_aabb3,
+    (AABB3, Point3): _connect_aabb3_point3,
+    (Point3, Triangle3): _connect_point3_triangle3,
+    (Triangle3, Point3): _connect_triangle3_point3,
+}
+
+_intersect_cache = {}
+_connect_cache = {}
+
+def _intersect_unimplemented(A, B):
+    raise AttributeError, 'Cannot intersect %s and %s' % \
+        (A.__class__, B.__class__)
+
+def _connect_unimplemented(A, B):
+    raise AttributeError, 'Cannot connect %s to %s' % \
+        (A.__class__, B.__class__)
+
+def _resolve(kernels, cache, A, B, default):
+    kernel = default
+    for a in inspect.getmro(A):
+        for b in inspect.getmro(B):
+            if (a, b) in kernels:
+                kernel = kernels[a, b]
+                break
+        if kernel is not default:
+            break
+    cache[A, B] = kernel
+    return kernel
+
+def register_intersect(type_a, type_b, kernel, symmetric=False):
+    """Make a.intersect(b) call kernel(a, b) for a type_a and b type_b.
+
+    Subclasses of type_a and type_b use the kernel too unless they have
+    one of their own.  If symmetric is true, b.intersect(a) is registered
+    as well, calling kernel(a, b).
+    """
+    _intersect_kernels[type_a, type_b] = kernel
+    if symmetric and type_a is not type_b:
+        _intersect_kernels[type_b, type_a] = lambda B, A: kernel(A, B)
+    _intersect_cache.clear()
+
+def register_connect(type_a, type_b, kernel, symmetric=False):
+    """Make a.connect(b) call kernel(a, b) for a type_a and b type_b.
+
+    kernel returns the shortest line segment from a to b, or None.  If
+    symmetric is true, b.connect(a) is registered as well, returning the
+    same segment with its end points swapped.
+    """
+    _connect_kernels[type_a, type_b] = kernel
+    if symmetric and type_a is not type_b:
+        _connect_kernels[type_b, type_a] = \
+            lambda B, A: _swapped(kernel(A, B))
+    _connect_cache.clear()
+
+# Bounding volume hierarchy
+# An AABB tree over 3D geometry, so that intersection, nearest and overlap
+# queries against many objects don't test every pair.  Pure Python like the
+# geometry classes above, boxes are tuples (x0, y0, z0, x1, y1, z1).
+# ---------------------------------------------------------------------------
+
+def _bounds3(obj):
+    """Return the box of obj, or None for lines, rays and planes."""
+    if isinstance(obj, Vector3):
+        return (obj.x, obj.y, obj.z, obj.x, obj.y, obj.z)
+    elif isinstance(obj, Sphere):
+        c, r = obj.c, obj.r
+        return (c.x - r, c.y - r, c.z - r, c.x + r, c.y + r, c.z + r)
+    elif isinstance(obj, LineSegment3):
+        p, q = obj.p, obj.p2
+        return (min(p.x, q.x), min(p.y, q.y), min(p.z, q.z),
+                max(p.x, q.x), max(p.y, q.y), max(p.z, q.z))
+    elif isinstance(obj, (Line3, Plane)):
+        return None
+    raise AttributeError, 'Cannot bound %s' % obj.__class__
+
+def _union3(boxes):
+    return (min([b[0] for b in boxes]), min([b[1] for b in boxes]),
+            min([b[2] for b in boxes]), max([b[3] for b in boxes]),
+            max([b[4] for b in boxes]), max([b[5] for b in boxes]))
+
+def _box_distance3(a, b):
+    """Distance between two boxes, 0 where they overlap."""
+    d2 = 0.0
+    for k in (0, 1, 2):
+        gap = max(a[k] - b[k + 3], b[k] - a[k + 3], 0.0)
+        d2 += gap * gap
+    return math.sqrt(d2)
+
+def _box_size3(box):
+    return box[3] - box[0] + box[4] - box[1] + box[5] - box[2]
+
+def _distance3(a, b):
+    """Distance between 3D geometry a and b, 0 where they intersect."""
+    # Spheres are solid: measure from the center, less the radius
+    r = 0.0
+    if isinstance(a, Sphere):
+        a, r = Point3(a.c.x, a.c.y, a.c.z), r + a.r
+    if isinstance(b, Sphere):
+        b, r = Point3(b.c.x, b.c.y, b.c.z), r + b.r
+    c = a.connect(b)
+    if c is None:
+        return 0.0
+    return max(abs(c) - r, 0.0)
+
+def _line_bounds3(line):
+    """Return the box of a line, ray or segment, infinite where it is."""
+    if isinstance(line, LineSegment3):
+        return _bounds3(line)
+    inf = float('inf')
+    ray = isinstance(line, Ray3)
+    lo, hi = [], []
+    for p, v in ((line.p.x, line.v.x), (line.p.y, line.v.y),
+                 (line.p.z, line.v.z)):
+        if v == 0:
+            lo.append(p)
+            hi.append(p)
+        elif v > 0:
+            lo.append(p if ray else -inf)
+            hi.append(inf)
+        else:
+            lo.append(-inf)
+            hi.append(p if ray else inf)
+    return tuple(lo + hi)
+
+def _box_bound3(query, tolerance=None):
+    """Return a function giving a lower bound of the distance between
+    query and anything inside a box.  With a tolerance, the bound of a line
+    may be raised to infinity if it passes the box farther than that."""
+    if isinstance(query, Line3):
+        qbox = _line_bounds3(query)
+        if tolerance is None:
+            return lambda box: _box_distance3(qbox, box)
+        # slab test of the line against the box grown by tolerance
+        p = (query.p.x, query.p.y, query.p.z)
+        v = (query.v.x, query.v.y, query.v.z)
+        inf = float('inf')
+        if isinstance(query, LineSegment3):
+            u_range = (0.0, 1.0)
+        elif isinstance(query, Ray3):
+            u_range = (0.0, inf)
+        else:
+            u_range = (-inf, inf)
+        def bound(box):
+            u0, u1 = u_range
+            for k in (0, 1, 2):
+                lo = box[k] - tolerance
+                hi = box[k + 3] + tolerance
+                if v[k] == 0:
+                    if p[k] < lo or p[k] > hi:
+                        return inf
+                else:
+                    a = (lo - p[k]) / v[k]
+                    b = (hi - p[k]) / v[k]
+                    if a > b:
+                        a, b = b, a
+                    u0 = max(u0, a)
+                    u1 = min(u1, b)
+                    if u0 > u1:
+                        return inf
+            return _box_distance3(qbox, box)
+    elif isinstance(query, Plane):
+        m = abs(query.n)
+        n = (query.n.x / m, query.n.y / m, query.n.z / m)
+        k = query.k / m
+        def bound(box):
+            center = (n[0] * (box[0] + box[3]) + n[1] * (box[1] + box[4]) +
+                      n[2] * (box[2] + box[5])) * 0.5
+            extent = (abs(n[0]) * (box[3] - box[0]) +
+                      abs(n[1]) * (box[4] - box[1]) +
+                      abs(n[2]) * (box[5] - box[2])) * 0.5
+            return max(abs(center - k) - extent, 0.0)
+    else:
+        qbox = _bounds3(query)
+        def bound(box):
+            return _box_distance3(qbox, box)
+    return bound
+
+class BVH:
+    """Bounding volume hierarchy over 3D geometry.
+
+    Built once over a sequence of Point3, Sphere, LineSegment3, Line3, Ray3
+    and Plane objects.  Unbounded objects (lines, rays, planes) are kept
+    aside and tested by every query.
+    """
+
+    def __init__(self, objects, leaf_size=4):
+        self.objects = list(objects)
+        self.leaf_size = leaf_size
+        self._boxes = []     # box of each node
+        self._children = []  # (left, right) node indices, None for leaves
+        self._items = []     # [(box, object)] of leaves
+        self._unbounded = []
+        items = []
+        for obj in self.objects:
+            box = _bounds3(obj)
+            if box is None:
+                self._unbounded.append(obj)
+            else:
+                items.append((box, obj))
+        self._bounded = [obj for box, obj in items]
+        if items:
+            self._build(items)
+
+    def __repr__(self):
+        return 'BVH(%d objects, %d nodes)' % (len(self.objects),
+                                              len(self._boxes))
+
+    def __len__(self):
+        return len(self.objects)
+
+    def _build(self, items):
+        # Top-down, splitting at the median centroid of the longest axis
+        i = len(self._boxes)
+        self._boxes.append(_union3([box for box, obj in items]))
+        self._children.append(None)
+        self._items.append(None)
+        centers = [[box[k] + box[k + 3] for k in (0, 1, 2)]
+                   for box, obj in items]
+        extent = [max([c[k] for c in centers]) - min([c[k] for c in centers])
+                  for k in (0, 1, 2)]
+        axis = extent.index(max(extent))
+        if len(items) <= self.leaf_size or extent[axis] == 0:
+            self._items[i] = items
+            return i
+        items.sort(key=lambda item: item[0][axis] + item[0][axis + 3])
+        half = len(items) // 2
+        self._children[i] = (self._build(items[:half]),
+                             self._build(items[half:]))
+        return i
+
+    def intersect(self, query, tolerance=0.0):
+        """Return the objects within tolerance of query, which may be any
+        3D geometry; a Ray3 or LineSegment3 casts a ray or sweeps a
+        segment, a Sphere finds the objects overlapping it."""
+        bound = _box_bound3(query, tolerance)
+        hits = [obj for obj in self._unbounded
+                if _distance3(query, obj) <= tolerance]
+        stack = self._boxes and [0] or []
+        while stack:
+            i = stack.pop()
+            if bound(self._boxes[i]) > tolerance:
+                continue
+            children = self._children[i]
+            if children:
+                stack.extend(children)
+                continue
+            for box, obj in self._items[i]:
+                if bound(box) <= tolerance and \
+                   _distance3(query, obj) <= tolerance:
+                    hits.append(obj)
+        return hits
+
+    def intersect_many(self, queries, tolerance=0.0):
+        """Return a list of intersect results, one per query."""
+        return [self.intersect(query, tolerance) for query in queries]
+
+    def nearest(self, query, max_distance=None):
+        """Return (object, distance) of the object nearest to query, or
+        (None, max_distance) if none is closer than max_distance."""
+        best = None
+        if max_distance is None:
+            max_distance = float('inf')
+        for obj in self._unbounded:
+            d = _distance3(query, obj)
+            if d < max_distance:
+                best, max_distance = obj, d
+        if not self._boxes:
+            return best, max_distance
+        bound = _box_bound3(query)
+        heap = [(bound(self._boxes[0]), 0)]
+        while heap:
+            d, i = heapq.heappop(heap)
+            if d >= max_distance:
+                break
+            children = self._children[i]
+            if children:
+                for j in children:
+                    d = bound(self._boxes[j])
+                    if d < max_distance:
+                        heapq.heappush(heap, (d, j))
+                continue
+            for box, obj in self._items[i]:
+                if bound(box) < max_distance:
+                    d = _distance3(query, obj)
+                    if d < max_distance:
+                        best, max_distance = obj, d
+        return best, max_distance
+
+    def nearest_many(self, queries, max_distance=None):
+        """Return a list of nearest results, one per query."""
+        return [self.nearest(query, max_distance) for query in queries]
+
+    def overlap(self, other=None, tolerance=0.0):
+        """Return the pairs (a, b) of objects of self and other within
+        tolerance of each other.  Without other, the pairs of distinct
+        objects of self are returned, each pair once."""
+        inner = other is None
+        if inner:
+            other = self
+        pairs = []
+        # unbounded objects against everything, brute force
+        for k, b in enumerate(other._unbounded):
+            if inner:
+                objects = self._bounded + self._unbounded[:k]
+            else:
+                objects = self.objects
+            pairs.extend([(a, b) for a in objects
+                          if _distance3(a, b) <= tolerance])
+        if not inner:
+            for a in self._unbounded:
+                pairs.extend([(a, b) for b in other._bounded
+                              if _distance3(a, b) <= tolerance])
+        if not self._boxes or not other._boxes:
+            return pairs
+        # simultaneous descent of both trees
+        stack = [(0, 0)]
+        while stack:
+            i, j = stack.pop()
+            if _box_distance3(self._boxes[i], other._boxes[j]) > tolerance:
+                continue
+            ci, cj = self._children[i], other._children[j]
+            if inner and i == j:
+                if ci:
+                    stack.extend([(ci[0], ci[0]), (ci[1], ci[1]),
+                                  (ci[0], ci[1])])
+                    continue
+                items = self._items[i]
+                for k, (box_a, a) in enumerate(items):
+                    for box_b, b in items[k + 1:]:
+                        if _box_distance3(box_a, box_b) <= tolerance and \
+                           _distance3(a, b) <= tolerance:
+                            pairs.append((a, b))
+            elif ci and (not cj or _box_size3(self._boxes[i]) >
+                                   _box_size3(other._boxes[j])):
+                stack.extend([(ci[0], j), (ci[1], j)])
+            elif cj:
+                stack.extend([(i, cj[0]), (i, cj[1])])
+            else:
+                for box_a, a in self._items[i]:
+                    for box_b, b in other._items[j]:
+                        if _box_distance3(box_a, box_b) <= tolerance and \
+                           _distance3(a, b) <= tolerance:
+                            pairs.append((a, b))
+        return pairs
+
+# Arrays
+# Structure-of-arrays counterparts of Vector3 and Point3, holding N
+# elements in one (N,3) numpy array.  Operations run vectorized over all
+# elements; indexing with an integer gives back a scalar Vector3/Point3.
+# ---------------------------------------------------------------------------
+
+def _as_xyz(other):
+    """Return other as numpy data: (N,3), (3,) or scalar/(N,) factors."""
+    if isinstance(other, Vector3Array):
+        return other.xyz
+    elif isinstance(other, Vector3):
+        return numpy.array((other.x, other.y, other.z))
+    return numpy.asarray(other, dtype=numpy.float64)
+
+def _is_point(other):
+    return isinstance(other, (Point3, Point3Array))
+
+def _column(values):
+    """Scalars and (N,) arrays as factors broadcasting against (N,3)."""
+    values = numpy.asarray(values, dtype=numpy.float64)
+    if values.ndim == 1:
+        return values[:, numpy.newaxis]
+    return values
+
+class Vector3Array:
+    __slots__ = ['xyz']
+    __hash__ = None
+
+    _scalar = Vector3
+
+    def __init__(self, data=(), copy=True):
+        if numpy is None:
+            raise ImportError('%s requires numpy' % self.__class__.__name__)
+        if isinstance(data, Vector3Array):
+            data = data.xyz
+        elif len(data) and isinstance(data[0], Vector3):
+            data = [(v.x, v.y, v.z) for v in data]
+        xyz = numpy.array(data, dtype=numpy.float64, copy=copy)
+        self.xyz = xyz.reshape(-1, 3)
+
+    def __copy__(self):
+        return self.__class__(self.xyz)
+
+    copy = __copy__
+
+    def __repr__(self):
+        rows = ['(%.2f, %.2f, %.2f)' % tuple(v) for v in self.xyz[:6]]
+        if len(self.xyz) > 6:
+            rows.append('...')
+        return '%s([%s])' % (self.__class__.__name__, ', '.join(rows))
 
-    def _connect_sphere(self, other):
-        return _connect_sphere_plane(other, self)
+    def __len__(self):
+        return len(self.xyz)
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, long, numpy.integer)):
+            return self._scalar(*self.xyz[key].tolist())
+        return self.__class__(self.xyz[key], copy=False)
+
+    def __setitem__(self, key, value):
+        self.xyz[key] = _as_xyz(value)
+
+    def __iter__(self):
+        _scalar = self._scalar
+        for x, y, z in self.xyz.tolist():
+            yield _scalar(x, y, z)
+
+    def __array__(self, dtype=None):
+        if dtype is None:
+            return self.xyz
+        return self.xyz.astype(dtype)
+
+    x = property(lambda self: self.xyz[:, 0])
+    y = property(lambda self: self.xyz[:, 1])
+    z = property(lambda self: self.xyz[:, 2])
+
+    def _result(self, other, xyz):
+        # Vector + Vector -> Vector
+        # Vector + Point -> Point
+        # Point + Point -> Vector  (Point - Point alike)
+        if _is_point(self) != _is_point(other):
+            return Point3Array(xyz, copy=False)
+        return Vector3Array(xyz, copy=False)
+
+    def __add__(self, other):
+        return self._result(other, self.xyz + _as_xyz(other))
+
+    __radd__ = __add__
 
-    def _connect_plane(self, other):
-        return _connect_plane_plane(other, self)
+    def __iadd__(self, other):
+        self.xyz += _as_xyz(other)
+        return self
+
+    def __sub__(self, other):
+        return self._result(other, self.xyz - _as_xyz(other))
+
+    def __rsub__(self, other):
+        return self._result(other, _as_xyz(other) - self.xyz)
+
+    def __isub__(self, other):
+        self.xyz -= _as_xyz(other)
+        return self
+
+    def __mul__(self, other):
+        if isinstance(other, (Vector3, Vector3Array)):
+            # component-wise, Point if either is a Point
+            if _is_point(self) or _is_point(other):
+                _class = Point3Array
+            else:
+                _class = Vector3Array
+            return _class(self.xyz * _as_xyz(other), copy=False)
+        return self.__class__(self.xyz * _column(other), copy=False)
 
+    __rmul__ = __mul__
+
+    def __imul__(self, other):
+        self.xyz *= _column(other)
+        return self
+
+    def __div__(self, other):
+        return self.__class__(self.xyz / _column(other), copy=False)
+
+    __truediv__ = __div__
+
+    def __neg__(self):
+        return self.__class__(-self.xyz, copy=False)
+
+    __pos__ = __copy__
+
+    def __abs__(self):
+        return numpy.sqrt(self.magnitude_squared())
+
+    magnitude = __abs__
+
+    def magnitude_squared(self):
+        xyz = self.xyz
+        return numpy.einsum('ij,ij->i', xyz, xyz)
+
+    def normalize(self):
+        d = self.magnitude()
+        d[d == 0] = 1.0
+        self.xyz /= d[:, numpy.newaxis]
+        return self
+
+    def normalized(self):
+        return self.copy().normalize()
+
+    def dot(self, other):
+        other = _as_xyz(other)
+        if other.ndim == 1:
+            return numpy.dot(self.xyz, other)
+        return numpy.einsum('ij,ij->i', self.xyz, other)
+
+    def cross(self, other):
+        return Vector3Array(numpy.cross(self.xyz, _as_xyz(other)), copy=False)
+
+    def reflect(self, normal):
+        # assume normal is normalized
+        normal = _as_xyz(normal)
+        d = 2 * _column(self.dot(normal))
+        return self.__class__(self.xyz - d * normal, copy=False)
+
+    def rotate_around(self, axis, theta):
+        """Return the vectors rotated around axis through angle theta.
+        Right hand rule applies; theta may be a scalar or an (N,) array."""
+        axis = _as_xyz(axis)
+        if axis.ndim == 1:
+            r2 = numpy.dot(axis, axis)
+        else:
+            r2 = _column(numpy.einsum('ij,ij->i', axis, axis))
+        ct = _column(numpy.cos(theta))
+        st = _column(numpy.sin(theta)) / numpy.sqrt(r2)
+        dt = _column(self.dot(axis)) * (1 - ct) / r2
+        xyz = axis * dt + self.xyz * ct + numpy.cross(axis, self.xyz) * st
+        return self.__class__(xyz, copy=False)
+
+    def angle(self, other):
+        """Return the angles to the vectors other"""
+        other = _as_xyz(other)
+        if other.ndim == 1:
+            other_mag = math.sqrt(numpy.dot(other, other))
+        else:
+            other_mag = numpy.sqrt(numpy.einsum('ij,ij->i', other, other))
+        cos = self.dot(other) / (self.magnitude() * other_mag)
+        return numpy.arccos(numpy.clip(cos, -1.0, 1.0))
+
+    def project(self, other):
+        """Return the vectors projected on the vectors other"""
+        n = _as_xyz(other)
+        if n.ndim == 1:
+            n = n / math.sqrt(numpy.dot(n, n))
+        else:
+            n = n / _column(numpy.sqrt(numpy.einsum('ij,ij->i', n, n)))
+        return Vector3Array(_column(self.dot(n)) * n, copy=False)
+
+    def _apply_transform(self, t):
+        if isinstance(t, Quaternion):
+            self.xyz[:] = (QuaternionArray([t]) * self).xyz
+        else:
+            t.transform_vectors(self.xyz, out=self.xyz)
+
+class Point3Array(Vector3Array):
+    _scalar = Point3
+
+    def _apply_transform(self, t):
+        if isinstance(t, Quaternion):
+            Vector3Array._apply_transform(self, t)
+        else:
+            t.transform_points(self.xyz, out=self.xyz)
+
+    def distance(self, other):
+        """Return the (N,) distances to other, see connect_points."""
+        return connect_points(self, other)[1]
+
+def _as_wxyz(other):
+    """Return other as (N,4) or (4,) numpy data in w, x, y, z order."""
+    if isinstance(other, QuaternionArray):
+        return other.wxyz
+    elif isinstance(other, Quaternion):
+        return numpy.array((other.w, other.x, other.y, other.z))
+    return numpy.asarray(other, dtype=numpy.float64)
+
+class QuaternionArray:
+    # N quaternions in one (N,4) array, columns w, x, y, z like the
+    # transformations module.
+    __slots__ = ['wxyz']
+    __hash__ = None
+
+    def __init__(self, data=(), copy=True):
+        if numpy is None:
+            raise ImportError('%s requires numpy' % self.__class__.__name__)
+        if isinstance(data, QuaternionArray):
+            data = data.wxyz
+        elif len(data) and isinstance(data[0], Quaternion):
+            data = [(q.w, q.x, q.y, q.z) for q in data]
+        wxyz = numpy.array(data, dtype=numpy.float64, copy=copy)
+        self.wxyz = wxyz.reshape(-1, 4)
+
+    def __copy__(self):
+        return self.__class__(self.wxyz)
+
+    copy = __copy__
+
+    def __repr__(self):
+        rows = ['(%.2f, <%.2f, %.2f, %.2f>)' % tuple(q) for q in self.wxyz[:6]]
+        if len(self.wxyz) > 6:
+            rows.append('...')
+        return 'QuaternionArray([%s])' % ', '.join(rows)
+
+    def __len__(self):
+        return len(self.wxyz)
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, long, numpy.integer)):
+            return Quaternion(*self.wxyz[key].tolist())
+        return self.__class__(self.wxyz[key], copy=False)
+
+    def __setitem__(self, key, value):
+        self.wxyz[key] = _as_wxyz(value)
+
+    def __iter__(self):
+        for w, x, y, z in self.wxyz.tolist():
+            yield Quaternion(w, x, y, z)
+
+    def __array__(self, dtype=None):
+        if dtype is None:
+            return self.wxyz
+        return self.wxyz.astype(dtype)
+
+    w = property(lambda self: self.wxyz[:, 0])
+    x = property(lambda self: self.wxyz[:, 1])
+    y = property(lambda self: self.wxyz[:, 2])
+    z = property(lambda self: self.wxyz[:, 3])
+
+    def __mul__(self, other):
+        if isinstance(other, (Quaternion, QuaternionArray)):
+            return QuaternionArray(_multiply(self.wxyz, _as_wxyz(other)),
+                                   copy=False)
+        elif isinstance(other, (Vector3, Vector3Array)):
+            # q v q*, as Quaternion.__mul__ (not normalized)
+            V = _as_xyz(other)
+            w = self.wxyz[:, 0:1]
+            u = self.wxyz[:, 1:]
+            uu = numpy.einsum('ij,ij->i', u, u)[:, numpy.newaxis]
+            uv = numpy.sum(u * V, axis=-1)[:, numpy.newaxis]
+            xyz = (w * w - uu) * V + 2 * uv * u + 2 * w * numpy.cross(u, V)
+            if _is_point(other):
+                return Point3Array(xyz, copy=False)
+            return Vector3Array(xyz, copy=False)
+        return NotImplemented
+
+    def __imul__(self, other):
+        self.wxyz[:] = _multiply(self.wxyz, _as_wxyz(other))
+        return self
+
+    def _apply_transform(self, q):
+        # Quaternion * QuaternionArray
+        self.wxyz[:] = _multiply(_as_wxyz(q), self.wxyz)
+
+    def __abs__(self):
+        return numpy.sqrt(self.magnitude_squared())
+
+    magnitude = __abs__
+
+    def magnitude_squared(self):
+        wxyz = self.wxyz
+        return numpy.einsum('ij,ij->i', wxyz, wxyz)
+
+    def conjugated(self):
+        Q = -self.wxyz
+        Q[:, 0] *= -1
+        return QuaternionArray(Q, copy=False)
+
+    def normalize(self):
+        d = self.magnitude()
+        d[d == 0] = 1.0
+        self.wxyz /= d[:, numpy.newaxis]
+        return self
+
+    def normalized(self):
+        return self.copy().normalize()
+
+    def get_matrix(self):
+        """Return the rotations as an (N,4,4) array of row-major matrices,
+        see Quaternion.get_matrix and Matrix4.to_numpy."""
+        w, x, y, z = self.wxyz.T
+        M = numpy.zeros((len(w), 4, 4))
+        M[:, 0, 0] = 1 - 2 * (y * y + z * z)
+        M[:, 0, 1] = 2 * (x * y - z * w)
+        M[:, 0, 2] = 2 * (x * z + y * w)
+        M[:, 1, 0] = 2 * (x * y + z * w)
+        M[:, 1, 1] = 1 - 2 * (x * x + z * z)
+        M[:, 1, 2] = 2 * (y * z - x * w)
+        M[:, 2, 0] = 2 * (x * z - y * w)
+        M[:, 2, 1] = 2 * (y * z + x * w)
+        M[:, 2, 2] = 1 - 2 * (x * x + y * y)
+        M[:, 3, 3] = 1.0
+        return M
+
+    # Static constructors
+    def new_rotate_axis(cls, angle, axis):
+        """angle is a scalar or (N,) array, axis a Vector3 or (N,3) array."""
+        axis = _as_xyz(axis)
+        axis = axis / numpy.sqrt(numpy.sum(axis * axis, axis=-1))[..., None]
+        angle = numpy.asarray(angle, dtype=numpy.float64)[..., None] * 0.5
+        xyz = numpy.sin(angle) * axis
+        w = numpy.broadcast_to(numpy.cos(angle), xyz.shape[:-1] + (1,))
+        return cls(numpy.concatenate((w, xyz), axis=-1), copy=False)
+    new_rotate_axis = classmethod(new_rotate_axis)
+
+    def new_interpolate(cls, q1, q2, t):
+        """Spherical linear interpolation between q1 and q2 at t.
+
+        q1 and q2 are Quaternion or QuaternionArray, t is a scalar or an
+        (N,) array; the arguments broadcast against each other.  Takes the
+        shortest path, nearly parallel pairs are interpolated linearly.
+        """
+        q1 = _as_wxyz(q1)
+        q2 = _as_wxyz(q2)
+        t = numpy.asarray(t, dtype=numpy.float64)[..., None]
+        costheta = numpy.sum(q1 * q2, axis=-1)[..., None]
+        # q and -q are the same rotation
+        q1 = numpy.where(costheta < 0, -q1, q1)
+        costheta = numpy.minimum(numpy.abs(costheta), 1.0)
+        theta = numpy.arccos(costheta)
+        sintheta = numpy.sin(theta)
+        linear = sintheta < 1e-6
+        sintheta[linear] = 1.0
+        ratio1 = numpy.where(linear, 1 - t, numpy.sin((1 - t) * theta) / sintheta)
+        ratio2 = numpy.where(linear, t, numpy.sin(t * theta) / sintheta)
+        return cls(q1 * ratio1 + q2 * ratio2, copy=False)
+    new_interpolate = classmethod(new_interpolate)
+
+def _multiply(A, B):
+    """Hamilton product of broadcasting (..., 4) arrays, see Quaternion.__mul__"""
+    Aw, Ax, Ay, Az = numpy.moveaxis(A, -1, 0)
+    Bw, Bx, By, Bz = numpy.moveaxis(B, -1, 0)
+    return numpy.stack((-Ax * Bx - Ay * By - Az * Bz + Aw * Bw,
+                         Ax * Bw + Ay * Bz - Az * By + Aw * Bx,
+                        -Ax * Bz + Ay * Bw + Az * Bx + Aw * By,
+                         Ax * By - Ay * Bx + Az * Bw + Aw * Bz), axis=-1)
+
+# Batch intersection
+# ---------------------------------------------------------------------------
+
+def _cells_near2(x, y, eps=1e-9):
+    """Return (index, cx, cy), the grid cells within eps of the points
+    (x, y) given in cell units, so that a point on a cell boundary is in
+    the cells on both sides of it."""
+    index = numpy.arange(len(x))
+    cells = [(index, numpy.floor(x + ex), numpy.floor(y + ey))
+             for ex in (-eps, eps) for ey in (-eps, eps)]
+    index, cx, cy = [numpy.concatenate(c) for c in zip(*cells)]
+    return index, cx.astype(numpy.int64), cy.astype(numpy.int64)
+
+def intersect_segments2(segments, cell_size=None, chunk_size=1 << 20):
+    """Find all intersections among 2D line segments in one call.
+
+    segments is a sequence of LineSegment2 or an (N,2,2) array of end
+    points.  Returns (pairs, points), an (M,2) array of index pairs i < j
+    and an (M,2) array of the points where segments i and j intersect,
+    as segments[i].intersect(segments[j]) would for every pair.
+
+    A uniform grid serves as broadphase: each segment is entered in the
+    grid cells it passes through, and only segments sharing a cell are
+    tested, in blocks of about chunk_size candidate pairs.  cell_size
+    defaults to the mean extent of the segments, which keeps the number
+    of cell entries within a small multiple of the number of segments.
+    """
+    if numpy is None:
+        raise ImportError('intersect_segments2 requires numpy')
+    if len(segments) and isinstance(segments[0], Line2):
+        segments = [((s.p.x, s.p.y), (s.p.x + s.v.x, s.p.y + s.v.y))
+                    for s in segments]
+    P = numpy.asarray(segments, dtype=numpy.float64).reshape(-1, 2, 2)
+    n = len(P)
+    if n < 2:
+        return numpy.zeros((0, 2), numpy.intp), numpy.zeros((0, 2))
+    p = P[:, 0]
+    v = P[:, 1] - P[:, 0]
+    lo = P.min(axis=1)
+    hi = P.max(axis=1)
+
+    # cells passed by each segment: those around its end points and around
+    # the points where it crosses grid lines, snapped onto the lines
+    origin = lo.min(axis=0)
+    if cell_size is None:
+        cell_size = numpy.abs(v).max(axis=1).mean()
+    if not cell_size > 0:
+        cell_size = max((hi.max(axis=0) - origin).max(), 1.0)
+    a = (P[:, 0] - origin) / cell_size
+    b = (P[:, 1] - origin) / cell_size
+    w = b - a
+    segs = [numpy.arange(n), numpy.arange(n)]
+    points = [a, b]
+    for k in (0, 1):
+        first = numpy.floor(numpy.minimum(a[:, k], b[:, k])) + 1
+        last = numpy.ceil(numpy.maximum(a[:, k], b[:, k])) - 1
+        count = numpy.maximum(last - first + 1, 0).astype(numpy.int64)
+        seg = numpy.repeat(numpy.arange(n), count)
+        line = numpy.repeat(first, count) + numpy.arange(len(seg)) - \
+            numpy.repeat(numpy.cumsum(count) - count, count)
+        t = (line - a[seg, k]) / w[seg, k]
+        crossing = a[seg] + t[:, numpy.newaxis] * w[seg]
+        crossing[:, k] = line
+        segs.append(seg)
+        points.append(crossing)
+    points = numpy.concatenate(points)
+    index, cx, cy = _cells_near2(points[:, 0], points[:, 1])
+    seg = numpy.concatenate(segs)[index]
+    key = (cx + 1) * (cy.max() + 2) + (cy + 1)
+
+    # each segment once per cell
+    order = numpy.lexsort((seg, key))
+    key = key[order]
+    seg = seg[order]
+    keep = numpy.ones(len(key), bool)
+    keep[1:] = (key[1:] != key[:-1]) | (seg[1:] != seg[:-1])
+    key = key[keep]
+    seg = seg[keep]
+
+    # candidate pairs: each entry with the entries after it in its cell,
+    # taken in blocks of entries with about chunk_size pairs together
+    index = numpy.arange(len(key))
+    after = numpy.searchsorted(key, key, side='right') - index - 1
+    total = numpy.cumsum(after)
+    pairs, hits = [], []
+    start = 0
+    while start < len(key):
+        stop = numpy.searchsorted(total, total[start] - after[start] +
+                                  chunk_size, side='right')
+        stop = max(stop, start + 1)
+        count = after[start:stop]
+        first = numpy.repeat(index[start:stop], count)
+        second = first + 1 + numpy.arange(len(first)) - \
+            numpy.repeat(numpy.cumsum(count) - count, count)
+        start = stop
+        i = numpy.minimum(seg[first], seg[second])
+        j = numpy.maximum(seg[first], seg[second])
+        overlap = numpy.all((lo[i] <= hi[j]) & (lo[j] <= hi[i]), axis=1)
+        i = i[overlap]
+        j = j[overlap]
+
+        # exact test, as _intersect_line2_line2
+        d = v[j, 1] * v[i, 0] - v[j, 0] * v[i, 1]
+        dy = p[i, 1] - p[j, 1]
+        dx = p[i, 0] - p[j, 0]
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            ua = (v[j, 0] * dy - v[j, 1] * dx) / d
+            ub = (v[i, 0] * dy - v[i, 1] * dx) / d
+            hit = (d != 0) & (ua >= 0) & (ua <= 1) & (ub >= 0) & (ub <= 1)
+        i, j, ua = i[hit], j[hit], ua[hit]
+        pairs.append(i * n + j)
+        hits.append(p[i] + ua[:, numpy.newaxis] * v[i])
+
+    # pairs sharing several cells were found more than once
+    pair, unique = numpy.unique(numpy.concatenate(pairs), return_index=True)
+    return (numpy.column_stack((pair // n, pair % n)),
+            numpy.concatenate(hits)[unique])
+
+def intersect_rays_triangles(origins, directions, triangles,
+                             max_distance=None, chunk_size=1 << 20):
+    """Cast N rays against M triangles and find the first hit of each.
+
+    origins and directions are Point3Array/Vector3Array or (N,3) arrays;
+    either may also be a single point or vector shared by all rays.
+    triangles is a sequence of Triangle3 or an (M,3,3) array of corners.
+    Returns (distance, index): the (N,) parameters t of the nearest hits
+    origin + t * direction, inf for rays that miss, and the (N,) indices
+    of the triangles hit, -1 for misses.  t is a distance when directions
+    are unit vectors; with max_distance=1.0 and directions b - a the rays
+    become segments from a to b, as for a line of sight check.
+
+    Rays are tested against triangles with the Moller-Trumbore algorithm,
+    as Ray3.intersect(Triangle3) but for all pairs at once, in blocks of
+    about chunk_size pairs to bound memory.
+    """
+    if numpy is None:
+        raise ImportError('intersect_rays_triangles requires numpy')
+    if len(triangles) and isinstance(triangles[0], Triangle3):
+        triangles = [(tuple(t.p1), tuple(t.p2), tuple(t.p3))
+                     for t in triangles]
+    T = numpy.asarray(triangles, dtype=numpy.float64).reshape(-1, 3, 3)
+    O, D = numpy.broadcast_arrays(numpy.atleast_2d(_as_xyz(origins)),
+                                  numpy.atleast_2d(_as_xyz(directions)))
+    n = len(O)
+    distance = numpy.empty(n)
+    distance.fill(numpy.inf)
+    index = numpy.empty(n, numpy.intp)
+    index.fill(-1)
+    if max_distance is None:
+        max_distance = numpy.inf
+    p1 = T[:, 0]
+    e1 = T[:, 1] - p1
+    e2 = T[:, 2] - p1
+    step = max(1, chunk_size // max(n, 1))
+    for start in range(0, len(T), step):
+        stop = start + step
+        # (N,m,3) per ray and triangle in the block, as
+        # _intersect_line3_triangle3
+        h = numpy.cross(D[:, numpy.newaxis], e2[numpy.newaxis, start:stop])
+        d = numpy.einsum('nmk,mk->nm', h, e1[start:stop])
+        s = O[:, numpy.newaxis] - p1[numpy.newaxis, start:stop]
+        q = numpy.cross(s, e1[numpy.newaxis, start:stop])
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            a = numpy.einsum('nmk,nmk->nm', s, h) / d
+            b = numpy.einsum('nk,nmk->nm', D, q) / d
+            t = numpy.einsum('nmk,mk->nm', q, e2[start:stop]) / d
+            hit = (d != 0) & (a >= 0) & (a <= 1) & (b >= 0) & \
+                  (a + b <= 1) & (t >= 0) & (t <= max_distance)
+        t[~hit] = numpy.inf
+        best = t.argmin(axis=1)
+        t = t[numpy.arange(n), best]
+        closer = t < distance
+        distance[closer] = t[closer]
+        index[closer] = best[closer] + start
+    return distance, index
+
+# Point kernels
+# Array versions of _connect_point3_line3, _connect_point3_plane and
+# friends: many points against one primitive, returning arrays instead of
+# one LineSegment per point.
+# ---------------------------------------------------------------------------
+
+def _connect_points_line(P, L):
+    p = numpy.array(tuple(L.p))
+    v = numpy.array(tuple(L.v))
+    d = numpy.dot(v, v)
+    assert d != 0
+    u = numpy.dot(P - p, v) / d
+    if isinstance(L, (LineSegment2, LineSegment3)):
+        u = numpy.clip(u, 0.0, 1.0)
+    elif isinstance(L, (Ray2, Ray3)):
+        u = numpy.maximum(u, 0.0)
+    return p + u[:, numpy.newaxis] * v, u
+
+def _connect_points_sphere(P, S):
+    # Sphere and Circle
+    c = numpy.array(tuple(S.c))
+    v = P - c
+    d = numpy.sqrt(numpy.einsum('ij,ij->i', v, v))
+    d[d == 0] = 1.0  # the center connects to itself, like normalize()
+    return c + v * (S.r / d)[:, numpy.newaxis], None
+
+def _connect_points_plane(P, plane):
+    n = numpy.array(tuple(plane.n))
+    d = numpy.dot(P, n) - plane.k
+    return P - (n / math.sqrt(numpy.dot(n, n))) * d[:, numpy.newaxis], None
+
+def _connect_points_point(P, Q):
+    return numpy.resize(numpy.array(tuple(Q), dtype=numpy.float64),
+                        P.shape), None
+
+_point_kernels = [
+    ((Line2, Line3), _connect_points_line),
+    ((Circle, Sphere), _connect_points_sphere),
+    (Plane, _connect_points_plane),
+    ((Vector2, Vector3), _connect_points_point),
+]
+
+def connect_points(points, other):
+    """Connect many points to other, like Point3.connect and Point2.connect.
+
+    points is a Point3Array or an (N,3) or (N,2) array, other a point,
+    line, ray, line segment, circle, sphere or plane of the same dimension.
+    Returns (closest, distance, u): the (N,D) closest points on other, the
+    (N,) distances to them and, if other is a line, the (N,) parameters u
+    of the closest points along it (None otherwise).
+    """
+    P = _as_xyz(points)
+    P = P.reshape(-1, P.shape[-1])
+    for types, kernel in _point_kernels:
+        if isinstance(other, types):
+            break
+    else:
+        raise AttributeError, 'Cannot connect points to %s' % \
+            other.__class__
+    closest, u = kernel(P, other)
+    v = closest - P
+    return closest, numpy.sqrt(numpy.einsum('ij,ij->i', v, v)), u
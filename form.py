@@ -26,10 +26,20 @@ Running FreeCAD standalone in Ubuntu
 
 """
 
+import bisect
+import collections
+import math
 import random
+import sys
+import types
 # import transformations as xf
 import euclid
 
+try:
+    import numpy
+except ImportError:
+    numpy = None  # e.g. IronPython in Rhino
+
 
 __author__  = 'Stefan Hechenberger <stefan@nortd.com>'
 __version__ = '2013.02'
@@ -38,6 +48,8 @@ __docformat__ = 'restructuredtext en'
 __all__ = ['get_active_view', 'refresh_view', 'view_all', 'view_selected',
            'clear_selection', 'get_selected', 'make_line', 'make_circle', 
            'make_interpolation_curve', 'make_random_curve',
+           'make_lines', 'make_circles', 'make_interpolation_curves',
+           'make_random_curves', 'clear_caches',
            'P','V', 'M', 'tM', 'sM', 'rM', 'raM', 'rxM', 'ryM', 'rzM',
            'Q', 'aQ', 'eQ', 'mQ', 'iQ']
 
@@ -46,6 +58,19 @@ __all__ = ['get_active_view', 'refresh_view', 'view_all', 'view_selected',
 # ############################################################################
 # General Implementation
 
+def _as_params(ts):
+    """Return parameters as flat float array (list when numpy is missing)."""
+    if numpy is None:
+        return [float(t) for t in ts]
+    return numpy.asarray(ts, dtype=numpy.float64).ravel()
+
+def _as_array(rows):
+    """Return rows as (N,3) or (N,) array (list when numpy is missing)."""
+    if numpy is None:
+        return rows
+    return numpy.array(rows, dtype=numpy.float64)
+
+
 class BaseApp():
     def __init__(self):
         BaseApp.__init__(self)
@@ -62,10 +87,115 @@ class BaseApp():
 
 
 
+class TessellationCache(object):
+    """Bounded LRU cache of tessellation results.
+
+    Entries are keyed by the backend object, a stamp of its geometry and
+    the tessellation arguments, so a transformed form never sees stale
+    points and new forms wrapping the same object share the entries.
+    The least recently used entries are evicted once either max_entries
+    or max_bytes is exceeded.
+    """
+
+    def __init__(self, max_entries=256, max_bytes=64*1024*1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.nbytes = 0
+        self._entries = collections.OrderedDict()  # key -> (value, nbytes)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Return cached value or None, marking it most recently used."""
+        try:
+            value, nbytes = self._entries.pop(key)
+        except KeyError:
+            self.misses += 1
+            return None
+        self._entries[key] = (value, nbytes)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        if key in self._entries:
+            self.nbytes -= self._entries.pop(key)[1]
+        nbytes = _nbytes(value)
+        if nbytes > self.max_bytes:
+            return
+        self._entries[key] = (value, nbytes)
+        self.nbytes += nbytes
+        while len(self._entries) > self.max_entries or \
+              self.nbytes > self.max_bytes:
+            self.nbytes -= self._entries.popitem(last=False)[1][1]
+
+    def clear(self):
+        self._entries.clear()
+        self.nbytes = 0
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses,
+                'entries': len(self._entries), 'nbytes': self.nbytes}
+
+
+def _nbytes(value):
+    """Memory estimate of a tessellation result."""
+    try:
+        return value.nbytes
+    except AttributeError:
+        return 64 * len(value)  # list of point objects
+
+
+# Process-wide caches
+# The macro runner of the CAD host reloads form, which rebinds all its
+# globals.  The registry lives in a module of its own in sys.modules, so
+# the caches taken from it survive reload(form).
+_REGISTRY = '_hypid_caches'
+
+def _caches():
+    try:
+        return sys.modules[_REGISTRY].caches
+    except KeyError:
+        module = types.ModuleType(_REGISTRY)
+        module.caches = {}
+        return sys.modules.setdefault(_REGISTRY, module).caches
+
+def get_cache(name, factory):
+    """Return the process-wide cache name, made by factory() on first use."""
+    caches = _caches()
+    try:
+        return caches[name]
+    except KeyError:
+        return caches.setdefault(name, factory())
+
+def clear_caches(name=None, drop=False):
+    """Clear the process-wide cache name, or all caches if name is None.
+
+    drop: also unregister the caches, e.g. after editing the cache class,
+          so that the next reload(form) creates them anew.
+    """
+    caches = _caches()
+    for key in list(caches) if name is None else [name]:
+        cache = caches.pop(key, None) if drop else caches.get(key)
+        if hasattr(cache, 'clear'):
+            cache.clear()
+
+
+
 class BaseForm():
 
+    # shared by all forms, set to None to disable caching
+    tessellation_cache = get_cache('tessellation', TessellationCache)
+    # collect transforms into one matrix, applied on flush or next query
+    deferred_transforms = False
+
     def __init__(self):
         self.obj = None
+        self._meta = {}    # curve metadata, valid for self._meta_key
+        self._meta_key = None  # _geometry_key() the metadata belongs to
+        self._pending = None  # composed deferred transforms
 
     # ###########################################
     # implemented in FreeCadForm, and RhinoForm
@@ -75,6 +205,37 @@ class BaseForm():
     def make_circle(cls, p1, p2): pass
     def make_interpolation_curve(cls, pts): pass
     def make_random_curve(cls, nPts=4, xr=(0,1), yr=(0,1), zr=(0,0), xsigma=0.5): pass
+    # Bulk Factories, one transaction/redraw for all, return list of forms
+    def make_lines(cls, pairs): pass
+    def make_circles(cls, radii, centers=None): pass
+    def make_interpolation_curves(cls, point_lists): pass
+
+    @classmethod
+    def make_random_curves(cls, count, nPts=4, xr=(0,1), yr=(0,1), zr=(0,0),
+                           xsigma=0.5, seed=None):
+        """Make count random curves like make_random_curve, in bulk.
+
+        All control points of the ensemble are drawn at once from a
+        generator seeded with seed, so the same seed gives the same
+        curves.
+        """
+        count, nPts = int(count), int(nPts)
+        if count == 0 or nPts == 0: return []
+        step = float(xr[1]-xr[0])/nPts
+        if numpy is None:
+            rand = random.Random(seed)
+            point_lists = [[(rand.gauss(xr[0]+i*step, xsigma*step),
+                             rand.uniform(yr[0],yr[1]),
+                             rand.uniform(zr[0],zr[1])) for i in range(nPts)]
+                           for c in range(count)]
+            return cls.make_interpolation_curves(point_lists)
+        rand = numpy.random.RandomState(seed)
+        pts = numpy.empty((count, nPts, 3))
+        pts[:, :, 0] = rand.normal(xr[0] + step*numpy.arange(nPts),
+                                   xsigma*step, (count, nPts))
+        pts[:, :, 1:] = rand.uniform((yr[0], zr[0]), (yr[1], zr[1]),
+                                     (count, nPts, 2))
+        return cls.make_interpolation_curves(pts)
     # Selection
     def select(self, ): pass
     def unselect(self): pass
@@ -86,79 +247,278 @@ class BaseForm():
     def is_closed_curve(self): pass
     # Curve Methods
     def length(self): pass
-    def value_at(self, t, paramNormalized=True): pass
-    def tangent_at(self, t, paramNormalized=True): pass
-    def curvature_at(self, t, paramNormalized=True): pass
-    def center_of_curvature_at(self, t, paramNormalized=True): pass
-    def derivative1_at(self, t, paramNormalized=True): pass
-    def derivative2_at(self, t, paramNormalized=True): pass
-    def derivative3_at(self, t, paramNormalized=True): pass
+    def bounding_box(self): pass
+    def value_at(self, t, paramNormalized=True, param=None): pass
+    def tangent_at(self, t, paramNormalized=True, param=None): pass
+    def curvature_at(self, t, paramNormalized=True, param=None): pass
+    def center_of_curvature_at(self, t, paramNormalized=True, param=None): pass
+    def derivative1_at(self, t, paramNormalized=True, param=None): pass
+    def derivative2_at(self, t, paramNormalized=True, param=None): pass
+    def derivative3_at(self, t, paramNormalized=True, param=None): pass
     def closest_curve_point(self, pt): pass
-    def tessellate(self, param): pass
+    def _tessellate(self, num): pass
+    def _point_xyz(self, p): pass  # backend point to coordinate tuple
+    def _make_point(self, xyz): pass  # and back
+    def _geometry_key(self): pass  # backend object and geometry stamp, or None
+    # Curve Methods, evaluating many parameters at once
+    def value_at_many(self, ts, paramNormalized=True, param=None): pass
+    def tangent_at_many(self, ts, paramNormalized=True, param=None): pass
+    def curvature_at_many(self, ts, paramNormalized=True, param=None): pass
+    def center_of_curvature_at_many(self, ts, paramNormalized=True, param=None): pass
+    def derivative1_at_many(self, ts, paramNormalized=True, param=None): pass
+    def derivative2_at_many(self, ts, paramNormalized=True, param=None): pass
+    def derivative3_at_many(self, ts, paramNormalized=True, param=None): pass
     # Surface Methods
     # def normal_at(self, u, v, paramNormalized=True): pass
     # General Geometry Methods
 
+    # Tessellation
+    _adaptive_start = 8       # initial even subdivision
+    _adaptive_max_depth = 24  # maximum number of bisections per segment
+    _adaptive_max_points = 1 << 20  # stop bisecting beyond this many points
+
+    def tessellate(self, num=None, tolerance=None):
+        """Tessellate curve.
+
+        num: number of points, if <= 1 distance as fraction of the length
+        tolerance: maximum deviation between curve and polyline. Segments
+                   get bisected until both the deviation at their middle
+                   and the sagitta estimated from curvature (k*l*l/8) are
+                   within tolerance, so straight runs get few points and
+                   tight bends many. Must be > 0. Returns an (N,3) array
+                   of at most _adaptive_max_points points.
+
+        Results are kept in tessellation_cache until the form changes.
+        Cached arrays are read-only, copy them before modifying. Lists of
+        backend points are rebuilt from their coordinates on every call.
+        """
+        if self._pending is not None:
+            self.flush()
+        cache = self.tessellation_cache
+        if cache is None or not self.is_curve():
+            return self._tessellate_uncached(num, tolerance)
+        geometry = self._geometry_key()
+        if not geometry:
+            return self._tessellate_uncached(num, tolerance)
+        key = (geometry, num, tolerance)
+        pts = cache.get(key)
+        if pts is None:
+            pts = self._tessellate_uncached(num, tolerance)
+            if pts is None:
+                return None
+            if hasattr(pts, 'setflags'):
+                pts.setflags(write=False)
+                cache.put(key, pts)
+            else:
+                # backend points are mutable, keep their coordinates only
+                cache.put(key, tuple([self._point_xyz(p) for p in pts]))
+        elif isinstance(pts, tuple):
+            pts = [self._make_point(xyz) for xyz in pts]
+        return pts
+
+    def _tessellate_uncached(self, num, tolerance):
+        if tolerance is not None:
+            return self._tessellate_adaptive(tolerance)
+        return self._tessellate(num)
+
+    def _tessellate_adaptive(self, tolerance):
+        if not tolerance > 0:
+            raise ValueError("tolerance must be > 0")
+        if not self.is_curve():
+            self.error("not a curve")
+            return None
+        if numpy is None:
+            self.error("tessellating by tolerance requires numpy")
+            return None
+        t0, t1 = self._param_from_normalized(0.0), \
+                 self._param_from_normalized(1.0)
+        if self.is_line_curve():
+            return self.value_at_many([t0, t1], paramNormalized=False)
+        ts = numpy.linspace(t0, t1, self._adaptive_start+1)
+        pts = self.value_at_many(ts, paramNormalized=False)
+        # segments that met the tolerance are not evaluated again
+        done = numpy.zeros(len(ts)-1, dtype=bool)
+        for depth in range(self._adaptive_max_depth):
+            todo = numpy.nonzero(~done)[0]
+            mids = 0.5*(ts[todo] + ts[todo+1])
+            mid_pts = self.value_at_many(mids, paramNormalized=False)
+            curvature = self.curvature_at_many(mids, paramNormalized=False)
+            # distance of the curve's mid point from the chord
+            chords = pts[todo+1] - pts[todo]
+            chord2 = numpy.sum(chords*chords, axis=1)
+            offsets = mid_pts - pts[todo]
+            with numpy.errstate(divide='ignore', invalid='ignore'):
+                u = numpy.sum(offsets*chords, axis=1) / chord2
+            u = numpy.where(chord2 > 0.0, numpy.clip(u, 0.0, 1.0), 0.0)
+            deviation = numpy.sqrt(numpy.sum(
+                (offsets - u[:, numpy.newaxis]*chords)**2, axis=1))
+            sagitta = numpy.nan_to_num(curvature) * chord2 / 8.0
+            split = numpy.maximum(deviation, sagitta) > tolerance
+            if not split.any():
+                break
+            if len(ts) + numpy.count_nonzero(split) > \
+               self._adaptive_max_points:
+                break
+            done[todo[~split]] = True
+            # interleave the mid points of the split segments, both halves
+            # of a split segment are checked in the next pass
+            insert_at = todo[split] + 1
+            ts = numpy.insert(ts, insert_at, mids[split])
+            done = numpy.insert(done, insert_at, False)
+            pts = numpy.insert(pts, insert_at, mid_pts[split], axis=0)
+        return pts
+
+    # Parameter Conversion
+    # param: None    ... paramNormalized decides between 'normalized' and 'raw'
+    #        'raw'   ... t in the curve's own parameter space
+    #        'normalized' ... t from 0 to 1.0 over the curve domain
+    #        'length'     ... t from 0 to 1.0 as fraction of the arc length,
+    #                         evenly spaced t give evenly spaced points
+    _length_table_size = 1024  # chords in the arc length lookup table
+
+    def _param(self, t, paramNormalized=True, param=None):
+        """Map t (scalar or array) to the curve's own parameter space."""
+        if param is None:
+            param = 'normalized' if paramNormalized else 'raw'
+        if numpy is None and isinstance(t, list):
+            return [self._param(ti, param=param) for ti in t]
+        if param == 'normalized':
+            return self._param_from_normalized(t)
+        elif param == 'length':
+            return self._param_from_length(t)
+        elif param == 'raw':
+            return t
+        raise ValueError("param must be 'raw', 'normalized' or 'length'")
+
+    def _param_from_length(self, s):
+        """Curve parameter at arc length fraction s, O(log n) per query."""
+        lengths, params = self._length_table()
+        if numpy is None:
+            i = min(max(bisect.bisect_right(lengths, s), 1), len(lengths)-1)
+            ds = lengths[i] - lengths[i-1]
+            f = (s - lengths[i-1]) / ds if ds else 0.0
+            return params[i-1] + f*(params[i] - params[i-1])
+        return numpy.interp(s, lengths, params)
+
+    def _length_table(self):
+        """Cumulative chord length (0 to 1.0) over evenly spaced params."""
+        def compute():
+            n = self._length_table_size
+            t0, t1 = self._param_from_normalized(0.0), \
+                     self._param_from_normalized(1.0)
+            params = [t0 + (t1-t0)*i/n for i in range(n+1)]
+            pts = self.value_at_many(params, paramNormalized=False)
+            if numpy is None:
+                lengths = [0.0]
+                for p0, p1 in zip(pts[:-1], pts[1:]):
+                    lengths.append(lengths[-1] + math.sqrt(
+                        sum((b-a)**2 for a, b in zip(p0, p1))))
+                return [l/lengths[-1] for l in lengths], params
+            lengths = numpy.zeros(n+1)
+            lengths[1:] = numpy.cumsum(
+                numpy.sqrt(numpy.sum(numpy.diff(pts, axis=0)**2, axis=1)))
+            return lengths/lengths[-1], numpy.array(params)
+        return self._cached('length_table', compute)
+
+    # Metadata Cache
+    def _cached(self, key, compute):
+        """Return metadata entry key, calling compute() on a miss.
+
+        Holds backend queries like domain, curve type, closedness,
+        length and bounding box so tight evaluation loops don't ask
+        the CAD backend again and again. The entries are dropped when
+        _geometry_key() changes, e.g. because another form wrapping the
+        same object transformed it.
+        """
+        if self._pending is not None:
+            self.flush()
+        geometry = self._geometry_key()
+        if geometry != self._meta_key:
+            self._meta.clear()
+            self._meta_key = geometry
+        try:
+            return self._meta[key]
+        except KeyError:
+            value = self._meta[key] = compute()
+            return value
+
+    def _invalidate(self):
+        """Drop all cached metadata. Call after changing the geometry."""
+        self._meta.clear()
+
     # Transformations
     # def transform_shape(self, mat): pass
-    def transform(self, mat): pass
+    def _transform(self, mat): pass  # implemented by the backends
+    def transform(self, mat):
+        """Apply mat (euclid.Matrix4) to the geometry.
+
+        With deferred_transforms enabled, matrices are composed into one
+        pending matrix and the backend is touched only once, on flush()
+        or the next query.
+        """
+        if self.deferred_transforms and isinstance(mat, euclid.Matrix4):
+            if self._pending is None:
+                self._pending = mat.copy()
+            else:
+                self._pending = mat * self._pending
+        else:
+            if self._pending is not None:
+                self.flush()
+            self._transform(mat)
+            self._invalidate()
+    def flush(self):
+        """Apply pending deferred transforms to the backend."""
+        mat, self._pending = self._pending, None
+        if mat is not None:
+            self._transform(mat)
+            self._invalidate()
+    def defer_transforms(self, enable=True):
+        """Switch deferred mode for this form, flushing when disabled."""
+        self.deferred_transforms = enable
+        if not enable:
+            self.flush()
     def translate(self, x, y, z):
         self.transform(tM(x, y, z))
     def scale(self, x, y, z, center=(0,0,0)):
         if center == V():
             mat = sM(x,y,z)
         else:
-            mat = (tM(center[0], center[1], center[2]) * 
-                   sM(x,y,z) * 
-                   tM(-center[0], -center[1], -center[2]))
+            mat = euclid.Matrix4.new_scale_about(x, y, z, center)
         self.transform(mat)
     def rotate(self, x, y, z, center=(0,0,0)):
         if center == V():
             mat = rM(y,z,x)
         else:
-            mat = (tM(center[0], center[1], center[2]) * 
-                   rM(y,z,x) * 
-                   tM(-center[0], -center[1], -center[2]))
+            mat = euclid.Matrix4.new_rotate_euler_about(y, z, x, center)
         self.transform(mat)
     def rotatex(self, angle, center=(0,0,0)):
         if center == V():
             mat = rxM(angle)
         else:
-            mat = (tM(center[0], center[1], center[2]) * 
-                   rxM(angle) * 
-                   tM(-center[0], -center[1], -center[2]))
+            mat = euclid.Matrix4.new_rotatex_about(angle, center)
         self.transform(mat)
     def rotatey(self, angle, center=(0,0,0)):
         if center == V():
             mat = ryM(angle)
         else:
-            mat = (tM(center[0], center[1], center[2]) * 
-                   ryM(angle) * 
-                   tM(-center[0], -center[1], -center[2]))
+            mat = euclid.Matrix4.new_rotatey_about(angle, center)
         self.transform(mat)
     def rotatez(self, angle, center=(0,0,0)):
         if center == V():
             mat = rzM(angle)
         else:
-            mat = (tM(center[0], center[1], center[2]) * 
-                   rzM(angle) * 
-                   tM(-center[0], -center[1], -center[2]))
+            mat = euclid.Matrix4.new_rotatez_about(angle, center)
         self.transform(mat)
     def rotate_axis(self, angle, axis, center=(0,0,0)):
         if center == V():
             mat = raM(angle, axis)
         else:
-            mat = (tM(center[0], center[1], center[2]) * 
-                   raM(angle, axis) * 
-                   tM(-center[0], -center[1], -center[2]))
+            mat = euclid.Matrix4.new_rotate_axis_about(angle, axis, center)
         self.transform(mat)
     def rotate_quat(self, quaternion, center=(0,0,0)):
-        if center == V():
-            mat = quaternion.get_matrix()
-        else:
-            mat = (tM(center[0], center[1], center[2]) * 
-                   quaternion.get_matrix() * 
-                   tM(-center[0], -center[1], -center[2]))
+        mat = quaternion.get_matrix()
+        if center != V():
+            mat.pivot(center)
         self.transform(mat)
 
 
@@ -287,6 +647,50 @@ class FreeCadForm(BaseForm):
         self.obj.Shape = crv.toShape()
         return self
 
+    @classmethod
+    def make_lines(cls, pairs):
+        return cls._add_shapes("hyLine", (Part.makeLine(tuple(p1), tuple(p2))
+                                          for p1, p2 in pairs))
+
+    @classmethod
+    def make_circles(cls, radii, centers=None):
+        if centers is None:
+            centers = [(0,0,0)]*len(radii)
+        def shapes():
+            for r, center in zip(radii, centers):
+                circ = Part.Circle()
+                circ.Radius = float(r)
+                circ.Center = FreeCAD.Vector(*tuple(center))
+                yield circ.toShape()
+        return cls._add_shapes("hyCircle", shapes())
+
+    @classmethod
+    def make_interpolation_curves(cls, point_lists):
+        def shapes():
+            for pts in point_lists:
+                crv = Part.BSplineCurve()
+                crv.interpolate([tuple(pt) for pt in pts])
+                yield crv.toShape()
+        return cls._add_shapes("hyCurve", shapes())
+
+    @classmethod
+    def _add_shapes(cls, name, shapes):
+        """Add shapes as document objects in one transaction and recompute
+        once, instead of once per object."""
+        doc = FreeCAD.ActiveDocument
+        forms = []
+        doc.openTransaction(name)
+        try:
+            for shape in shapes:
+                self = cls()
+                self.obj = doc.addObject("Part::Feature", name)
+                self.obj.Shape = shape
+                forms.append(self)
+        finally:
+            doc.commitTransaction()
+        doc.recompute()
+        return forms
+
 
     # ###########################################
     # Selection
@@ -308,20 +712,23 @@ class FreeCadForm(BaseForm):
 
     def is_curve(self):
         """Is this a single curve."""
-        return hasattr(self.obj.Shape, 'Curve')
+        return self._cached('is_curve',
+                            lambda: hasattr(self.obj.Shape, 'Curve'))
         # return self.obj.isDerivedFrom("Part::Feature") and \
         #        self.obj.Shape and self.obj.Shape.isValid() and \
         #        len(self.obj.Shape.Edges) == 1
 
     def is_line_curve(self):
-        return self.is_curve and type(self.obj.Shape.Curve) == Part.Line
+        return self.is_curve() and self._cached('curve_type',
+            lambda: type(self.obj.Shape.Curve)) == Part.Line
         # return self.is_curve and (len(self.obj.Shape.Edges[0].Vertexes) == 2)
 
     def is_planar_curve(self):
         self.error("not implemented")
 
     def is_closed_curve(self):
-        return self.is_curve and self.obj.Shape.isClosed()
+        return self.is_curve() and self._cached('closed',
+            lambda: self.obj.Shape.isClosed())
 
 
     # ###########################################
@@ -329,64 +736,71 @@ class FreeCadForm(BaseForm):
 
     def length(self):
         if self.is_curve():
-            return self.obj.Shape.Length
+            return self._cached('length', lambda: self.obj.Shape.Length)
         else:
             self.error("not a curve")
             return None
 
-    def value_at(self, t, paramNormalized=True):
+    def bounding_box(self):
+        """Return ((xmin, ymin, zmin), (xmax, ymax, zmax))."""
+        def compute():
+            bb = self.obj.Shape.BoundBox
+            return ((bb.XMin, bb.YMin, bb.ZMin), (bb.XMax, bb.YMax, bb.ZMax))
+        return self._cached('bounding_box', compute)
+
+    def value_at(self, t, paramNormalized=True, param=None):
         """param: 0 to 1.0"""
         if self.is_curve():
-            if paramNormalized: t = self._param_from_normalized(t)
+            t = self._param(t, paramNormalized, param)
             return self.obj.Shape.Edges[0].valueAt(t)
         else:
             self.error("not a curve")
             return None
 
-    def tangent_at(self, t, paramNormalized=True):
+    def tangent_at(self, t, paramNormalized=True, param=None):
         if self.is_curve():
-            if paramNormalized: t = self._param_from_normalized(t)
+            t = self._param(t, paramNormalized, param)
             return self.obj.Shape.Edges[0].tangentAt(t)
         else:
             self.error("not a curve")
             return None
 
-    def curvature_at(self, t, paramNormalized=True):
+    def curvature_at(self, t, paramNormalized=True, param=None):
         if self.is_curve():
-            if paramNormalized: t = self._param_from_normalized(t)
+            t = self._param(t, paramNormalized, param)
             return self.obj.Shape.Edges[0].curvatureAt(t)
         else:
             self.error("not a curve")
             return None
 
-    def center_of_curvature_at(self, t, paramNormalized=True):
+    def center_of_curvature_at(self, t, paramNormalized=True, param=None):
         # TODO: getting an exception
         if self.is_curve():
-            if paramNormalized: t = self._param_from_normalized(t)
+            t = self._param(t, paramNormalized, param)
             return self.obj.Shape.Edges[0].centerOfCurvatureAt(t)
         else:
             self.error("not a curve")
             return None
 
-    def derivative1_at(self, t, paramNormalized=True):
+    def derivative1_at(self, t, paramNormalized=True, param=None):
         if self.is_curve():
-            if paramNormalized: t = self._param_from_normalized(t)
+            t = self._param(t, paramNormalized, param)
             return self.obj.Shape.Edges[0].derivative1At(t)
         else:
             self.error("not a curve")
             return None
 
-    def derivative2_at(self, t, paramNormalized=True):
+    def derivative2_at(self, t, paramNormalized=True, param=None):
         if self.is_curve():
-            if paramNormalized: t = self._param_from_normalized(t)
+            t = self._param(t, paramNormalized, param)
             return self.obj.Shape.Edges[0].derivative2At(t)
         else:
             self.error("not a curve")
             return None
 
-    def derivative3_at(self, t, paramNormalized=True):
+    def derivative3_at(self, t, paramNormalized=True, param=None):
         if self.is_curve():
-            if paramNormalized: t = self._param_from_normalized(t)
+            t = self._param(t, paramNormalized, param)
             return self.obj.Shape.Edges[0].derivative3At(t)
         else:
             self.error("not a curve")
@@ -399,7 +813,7 @@ class FreeCadForm(BaseForm):
             self.error("not a curve")
             return None
 
-    def tessellate(self, num):
+    def _tessellate(self, num):
         """Return a list of points (vectors).
         param: number of points
                if under 1 then parameter t increment
@@ -410,10 +824,63 @@ class FreeCadForm(BaseForm):
             self.error("not a curve")
             return None
 
+    def _point_xyz(self, p):
+        return (p.x, p.y, p.z)
+
+    def _make_point(self, xyz):
+        return FreeCAD.Vector(*xyz)
+
+    def _geometry_key(self):
+        # hashCode() changes with every new shape, but may be reused once
+        # the old one is freed, the bounding box tells those apart
+        shape = getattr(self.obj, 'Shape', None)
+        if shape is None:
+            return None
+        box = shape.BoundBox
+        return (self.obj.Document.Name, self.obj.Name, shape.hashCode(),
+                (box.XMin, box.YMin, box.ZMin, box.XMax, box.YMax, box.ZMax))
+
+    def value_at_many(self, ts, paramNormalized=True, param=None):
+        """Return (N,3) array of points at parameters ts."""
+        return self._evaluate_many('valueAt', ts, paramNormalized, param)
+
+    def tangent_at_many(self, ts, paramNormalized=True, param=None):
+        return self._evaluate_many('tangentAt', ts, paramNormalized, param)
+
+    def curvature_at_many(self, ts, paramNormalized=True, param=None):
+        """Return (N,) array of curvatures at parameters ts."""
+        return self._evaluate_many('curvatureAt', ts, paramNormalized, param)
+
+    def center_of_curvature_at_many(self, ts, paramNormalized=True, param=None):
+        return self._evaluate_many('centerOfCurvatureAt', ts, paramNormalized, param)
+
+    def derivative1_at_many(self, ts, paramNormalized=True, param=None):
+        return self._evaluate_many('derivative1At', ts, paramNormalized, param)
+
+    def derivative2_at_many(self, ts, paramNormalized=True, param=None):
+        return self._evaluate_many('derivative2At', ts, paramNormalized, param)
+
+    def derivative3_at_many(self, ts, paramNormalized=True, param=None):
+        return self._evaluate_many('derivative3At', ts, paramNormalized, param)
+
+    def _evaluate_many(self, method, ts, paramNormalized, param):
+        # classify, convert and look up the edge method once for all ts
+        if self.is_curve():
+            ts = _as_params(ts)
+            ts = self._param(ts, paramNormalized, param)
+            evaluate = getattr(self.obj.Shape.Edges[0], method)
+            if method == 'curvatureAt':
+                return _as_array([evaluate(t) for t in ts])
+            return _as_array([tuple(evaluate(t)) for t in ts])
+        else:
+            self.error("not a curve")
+            return None
+
     def _param_from_normalized(self, t):
         # same as 0-self.obj.Shape.Length ?
-        return self.Shape.FirstParameter + \
-               t*(self.Shape.LastParameter-self.Shape.FirstParameter)
+        domain = self._cached('domain', lambda: (self.obj.Shape.FirstParameter,
+                                                 self.obj.Shape.LastParameter))
+        return domain[0] + t*(domain[1]-domain[0])
 
 
     # ###########################################
@@ -435,15 +902,13 @@ class FreeCadForm(BaseForm):
     # def transform_shape(self, matrix):
     #     self.obj.transformShape()
 
-    def transform(self, mat):
+    def _transform(self, mat):
         # fmat = FreeCAD.Matrix(mat[0][0],mat[0][1], mat[0][2],mat[0][3],
         #                       mat[1][0],mat[1][1], mat[1][2],mat[1][3],
         #                       mat[2][0],mat[2][1], mat[2][2],mat[2][3],
         #                       mat[3][0],mat[3][1], mat[3][2],mat[3][3])
-        fmat = FreeCAD.Matrix(mat[0],mat[4], mat[8],mat[12],
-                              mat[1],mat[5], mat[9],mat[13],
-                              mat[2],mat[6], mat[10],mat[14],
-                              mat[3],mat[7], mat[11],mat[15])
+        # rows of a euclid.Matrix4 or a 4x4 numpy array
+        fmat = FreeCAD.Matrix(*[x for row in mat.tolist() for x in row])
         self.obj.Shape = self.obj.Shape.transformGeometry(fmat)
 
 
@@ -539,6 +1004,39 @@ class RhinoForm(BaseForm):
         self.obj.Shape = crv.toShape()
         return self
 
+    @classmethod
+    def make_lines(cls, pairs):
+        return cls._add_objects(lambda: [rs.AddLine(p1, p2)
+                                         for p1, p2 in pairs])
+
+    @classmethod
+    def make_circles(cls, radii, centers=None):
+        if centers is None:
+            return cls._add_objects(lambda: [
+                rs.AddCircle(rs.WorldXYPlane(), r) for r in radii])
+        return cls._add_objects(lambda: [
+            rs.AddCircle(center, r) for r, center in zip(radii, centers)])
+
+    @classmethod
+    def make_interpolation_curves(cls, point_lists):
+        return cls._add_objects(lambda: [rs.AddInterpCurve(pts)
+                                         for pts in point_lists])
+
+    @classmethod
+    def _add_objects(cls, add):
+        """Run add() with redraw disabled, wrap the returned guids."""
+        rs.EnableRedraw(False)
+        try:
+            guids = add()
+        finally:
+            rs.EnableRedraw(True)
+        forms = []
+        for guid in guids:
+            self = cls()
+            self.obj = guid
+            forms.append(self)
+        return forms
+
 
     # ###########################################
     # Selection
@@ -559,53 +1057,62 @@ class RhinoForm(BaseForm):
     # Geometry Classification
 
     def is_curve(self):
-        return rs.IsCurve(self.obj)
+        return self._cached('is_curve', lambda: rs.IsCurve(self.obj))
 
     def is_line_curve(self):
-        return rs.IsLine(self.obj)
+        return self._cached('is_line', lambda: rs.IsLine(self.obj))
 
     def is_planar_curve(self):
-        return rs.IsCurvePlanar(self.obj)
+        return self._cached('planar', lambda: rs.IsCurvePlanar(self.obj))
 
     def is_closed_curve(self):
-        return rs.IsCurveClosed(self.obj)
+        return self._cached('closed', lambda: rs.IsCurveClosed(self.obj))
 
     # ###########################################
     # Curve Methods
 
     def length(self):
         if self.is_curve():
-            return rs.CurveLength(self.obj)
+            return self._cached('length', lambda: rs.CurveLength(self.obj))
         else:
             self.error("not a curve")
             return None
 
-    def value_at(self, t, paramNormalized=True):
+    def bounding_box(self):
+        """Return ((xmin, ymin, zmin), (xmax, ymax, zmax))."""
+        def compute():
+            corners = rs.BoundingBox(self.obj)  # 8 corner points
+            return (tuple(min(c[i] for c in corners) for i in range(3)),
+                    tuple(max(c[i] for c in corners) for i in range(3)))
+        return self._cached('bounding_box', compute)
+
+    def value_at(self, t, paramNormalized=True, param=None):
         """Return point at paramter t in space of the curve.
 
         FYI: While parameter space is evenly distributed for some curves,
         this is not true for NURBS. They are more widely spaced towards
         the ends, and more closely spaced at areas of dense control
-        points and more weighted CPs.
+        points and more weighted CPs. Use param='length' for evenly
+        spaced points.
         """
         if self.is_curve():
-            if paramNormalized: t = self._param_from_normalized(t)
+            t = self._param(t, paramNormalized, param)
             return rs.EvaluateCurve(t)   
         else:
             self.error("not a curve")
             return None
 
-    def tangent_at(self, t, paramNormalized=True):
+    def tangent_at(self, t, paramNormalized=True, param=None):
         if self.is_curve():
-            if paramNormalized: t = self._param_from_normalized(t)
+            t = self._param(t, paramNormalized, param)
             return rs.CurveTangent(self.obj, t)
         else:
             self.error("not a curve")
             return None
 
-    def curvature_at(self, t, paramNormalized=True):
+    def curvature_at(self, t, paramNormalized=True, param=None):
         if self.is_curve():
-            if paramNormalized: t = self._param_from_normalized(t)
+            t = self._param(t, paramNormalized, param)
             curvatureObj = rs.CurveCurvature(self.obj, t)
             if curvatureObj:
                 return curvatureObj[3]
@@ -619,9 +1126,9 @@ class RhinoForm(BaseForm):
             self.error("not a curve")
             return None
 
-    def center_of_curvature_at(self, t, paramNormalized=True):
+    def center_of_curvature_at(self, t, paramNormalized=True, param=None):
         if self.is_curve():
-            if paramNormalized: t = self._param_from_normalized(t)
+            t = self._param(t, paramNormalized, param)
             curvatureObj = rs.CurveCurvature(self.obj, t)
             if curvatureObj:
                 return curvatureObj[2]
@@ -631,85 +1138,685 @@ class RhinoForm(BaseForm):
             self.error("not a curve")
             return None
 
-    def derivative1_at(self, t, paramNormalized=True):
+    def derivative1_at(self, t, paramNormalized=True, param=None):
+        return self._derivative_at(1, t, paramNormalized, param)
+
+    def derivative2_at(self, t, paramNormalized=True, param=None):
+        return self._derivative_at(2, t, paramNormalized, param)
+
+    def derivative3_at(self, t, paramNormalized=True, param=None):
+        return self._derivative_at(3, t, paramNormalized, param)
+
+    def closest_curve_point(self, pt):
+        if self.is_curve():
+            return rs.CurveClosestPoint(self.obj, pt)
+        else:
+            self.error("not a curve")
+            return None
+
+    def _tessellate(self, num):
+        """Tessellate curve.
+        num: number of points
+             if <= 1 points with num distance in nomalized t"""
+        if self.is_curve():
+            if num <= 1.0:
+                seglen = num*self.length()
+                return rs.DivideCurveLength(self.obj, seglen)
+            else:
+                return rs.DivideCurve(self.obj, num-1)
+        else:
+            self.error("not a curve")
+            return None
+
+    def _point_xyz(self, p):
+        return _xyz(p)
+
+    def _make_point(self, xyz):
+        return rs.coerce3dpoint(xyz)
+
+    def _geometry_key(self):
+        # transforming replaces the object under the same guid, the
+        # replacement gets a new runtime serial number
+        rhobj = rs.coercerhinoobject(self.obj)
+        if rhobj is None:
+            return None
+        return (str(self.obj), rhobj.RuntimeSerialNumber)
+
+    def value_at_many(self, ts, paramNormalized=True, param=None):
+        """Return (N,3) array of points at parameters ts."""
+        crv, ts = self._curve_and_params(ts, paramNormalized, param)
+        if crv is None: return None
+        return _as_array([_xyz(crv.PointAt(t)) for t in ts])
+
+    def tangent_at_many(self, ts, paramNormalized=True, param=None):
+        crv, ts = self._curve_and_params(ts, paramNormalized, param)
+        if crv is None: return None
+        return _as_array([_xyz(crv.TangentAt(t)) for t in ts])
+
+    def curvature_at_many(self, ts, paramNormalized=True, param=None):
+        """Return (N,) array of curvatures (not radii) at parameters ts."""
+        crv, ts = self._curve_and_params(ts, paramNormalized, param)
+        if crv is None: return None
+        return _as_array([crv.CurvatureAt(t).Length for t in ts])
+
+    def center_of_curvature_at_many(self, ts, paramNormalized=True, param=None):
+        crv, ts = self._curve_and_params(ts, paramNormalized, param)
+        if crv is None: return None
+        centers = []
+        for t in ts:
+            p = crv.PointAt(t)
+            k = crv.CurvatureAt(t)
+            kk = k.SquareLength
+            if kk > 0.0:
+                centers.append((p.X + k.X/kk, p.Y + k.Y/kk, p.Z + k.Z/kk))
+            else:
+                centers.append((float('nan'),)*3)
+        return _as_array(centers)
+
+    def derivative1_at_many(self, ts, paramNormalized=True, param=None):
+        return self._derivative_many(1, ts, paramNormalized, param)
+
+    def derivative2_at_many(self, ts, paramNormalized=True, param=None):
+        return self._derivative_many(2, ts, paramNormalized, param)
+
+    def derivative3_at_many(self, ts, paramNormalized=True, param=None):
+        return self._derivative_many(3, ts, paramNormalized, param)
+
+    def _derivative_at(self, order, t, paramNormalized, param):
+        if self.is_curve():
+            t = self._param(t, paramNormalized, param)
+            crv = self._cached('curve', lambda: rs.coercecurve(self.obj))
+            return crv.DerivativeAt(t, order)[order]
+        else:
+            self.error("not a curve")
+            return None
+
+    def _derivative_many(self, order, ts, paramNormalized, param):
+        crv, ts = self._curve_and_params(ts, paramNormalized, param)
+        if crv is None: return None
+        return _as_array([_xyz(crv.DerivativeAt(t, order)[order]) for t in ts])
+
+    def _curve_and_params(self, ts, paramNormalized, param):
+        """Coerce to a RhinoCommon curve once for a whole batch."""
+        if self.is_curve():
+            ts = _as_params(ts)
+            ts = self._param(ts, paramNormalized, param)
+            return self._cached('curve', lambda: rs.coercecurve(self.obj)), ts
+        else:
+            self.error("not a curve")
+            return None, ts
+
+    def _param_from_normalized(self, t):
+        domain = self._cached('domain', lambda: rs.CurveDomain(self.obj))
+        return domain[0] + t*(domain[1]-domain[0])
+
+
+    # ###########################################
+    # Surface Methods
+
+
+    # ###########################################
+    # Transformations
+
+    # def transform_shape(self, matrix):
+    #     self.obj.transformShape()
+
+    def _transform(self, mat):
+        rs.TransformObject(self.obj, mat.tolist())
+
+
+def _xyz(p):
+    """Components of a RhinoCommon point or vector as tuple."""
+    return (p.X, p.Y, p.Z)
+
+
+# ############################################################################
+# Numpy Implementation (headless, no CAD process)
+
+class NumpyCurve(object):
+    """Curve geometry held in numpy arrays.
+
+    Takes the role of the document object for NumpyForm. The curve is
+    kept in local coordinates together with a 4x4 placement matrix, so
+    transforming is a single matrix product and stays exact for any
+    affine map (a circle scaled non-uniformly becomes an ellipse).
+
+    kind: 'line', 'circle' or 'bspline'
+    points: (n,3) local points (end points, interpolation points)
+    radius: circle radius
+    """
+
+    def __init__(self, kind, points=None, radius=None, name="hyCurve"):
+        self.kind = kind
+        self.name = name
+        self.radius = radius
+        self.matrix = numpy.identity(4)
+        self.version = 0  # bumped by transform
+        self.points = None
+        self.knots = None
+        self.moments = None
+        if points is not None:
+            self.points = numpy.array(points, dtype=numpy.float64, ndmin=2)
+        if kind == 'circle':
+            self.domain = (0.0, 2*numpy.pi)
+        else:
+            self.domain = (0.0, 1.0)
+        if kind == 'bspline':
+            self._interpolate()
+
+    def _interpolate(self):
+        """Natural cubic spline through points, chord length knots."""
+        pts = self.points
+        if len(pts) > 1:  # drop coincident neighbours, they have no span
+            keep = numpy.ones(len(pts), dtype=bool)
+            keep[1:] = numpy.any(numpy.diff(pts, axis=0) != 0.0, axis=1)
+            pts = self.points = pts[keep]
+        n = len(pts)
+        if n < 2:
+            raise ValueError("need at least two distinct points")
+        chords = numpy.sqrt(numpy.sum(numpy.diff(pts, axis=0)**2, axis=1))
+        knots = numpy.zeros(n)
+        knots[1:] = numpy.cumsum(chords)
+        knots /= knots[-1]
+        h = numpy.diff(knots)
+        moments = numpy.zeros((n, 3))
+        if n > 2:
+            A = numpy.zeros((n-2, n-2))
+            idx = numpy.arange(n-2)
+            A[idx, idx] = 2.0*(h[:-1] + h[1:])
+            A[idx[1:], idx[:-1]] = h[1:-1]
+            A[idx[:-1], idx[1:]] = h[1:-1]
+            slopes = numpy.diff(pts, axis=0) / h[:, numpy.newaxis]
+            moments[1:-1] = numpy.linalg.solve(A, 6.0*numpy.diff(slopes, axis=0))
+        self.knots = knots
+        self.moments = moments
+
+    def spans(self):
+        """Parameter breaks between smooth pieces of the curve."""
+        if self.kind == 'bspline':
+            return self.knots
+        elif self.kind == 'circle':
+            return numpy.linspace(self.domain[0], self.domain[1], 17)
+        return numpy.array(self.domain)
+
+    def local_derivatives(self, u, order=3):
+        """Return [value, d1, .., d<order>] as (N,3) arrays, local coords."""
+        u = numpy.asarray(u, dtype=numpy.float64).ravel()
+        if self.kind == 'line':
+            p1, p2 = self.points[0], self.points[1]
+            d1 = numpy.tile(p2 - p1, (len(u), 1))
+            ders = [p1 + u[:, numpy.newaxis]*(p2 - p1), d1,
+                    numpy.zeros_like(d1), numpy.zeros_like(d1)]
+        elif self.kind == 'circle':
+            r = self.radius
+            c = numpy.cos(u)
+            s = numpy.sin(u)
+            z = numpy.zeros_like(u)
+            ders = [r*numpy.column_stack((c, s, z)),
+                    r*numpy.column_stack((-s, c, z)),
+                    r*numpy.column_stack((-c, -s, z)),
+                    r*numpy.column_stack((s, -c, z))]
+        else:
+            knots, pts, M = self.knots, self.points, self.moments
+            i = numpy.searchsorted(knots, u, side='right') - 1
+            i = numpy.clip(i, 0, len(knots) - 2)
+            h = (knots[i+1] - knots[i])[:, numpy.newaxis]
+            a = (knots[i+1][:, numpy.newaxis] - u[:, numpy.newaxis]) / h
+            b = 1.0 - a
+            P0, P1, M0, M1 = pts[i], pts[i+1], M[i], M[i+1]
+            ders = [a*P0 + b*P1 + ((a**3 - a)*M0 + (b**3 - b)*M1)*(h*h/6.0),
+                    (P1 - P0)/h + ((1.0 - 3.0*a*a)*M0 + (3.0*b*b - 1.0)*M1)*(h/6.0),
+                    a*M0 + b*M1,
+                    (M1 - M0)/h]
+        return ders[:order+1]
+
+    def derivatives(self, u, order=3):
+        """Return [value, d1, .., d<order>] as (N,3) arrays, world coords."""
+        ders = self.local_derivatives(u, order)
+        rot = self.matrix[:3, :3].T
+        world = [numpy.dot(ders[0], rot) + self.matrix[:3, 3]]
+        for d in ders[1:]:
+            world.append(numpy.dot(d, rot))
+        return world
+
+    def length(self):
+        """Arc length by Gauss-Legendre quadrature per span."""
+        x, w = numpy.polynomial.legendre.leggauss(8)
+        spans = self.spans()
+        lo = spans[:-1, numpy.newaxis]
+        half = (numpy.diff(spans) / 2.0)[:, numpy.newaxis]
+        u = (lo + half*(x + 1.0)).ravel()
+        speed = numpy.sqrt(numpy.sum(self.derivatives(u, 1)[1]**2, axis=1))
+        return float(numpy.sum((speed.reshape(half.shape[0], -1)*w)*half))
+
+    def transform(self, mat):
+        self.matrix = numpy.dot(mat, self.matrix)
+        self.version += 1
+
+
+
+class NumpyApp(BaseApp):
+    """Headless application, the document is a plain list of curves."""
+
+    document = []
+    selection = []
+
+    def __init__(self):
+        BaseApp.__init__(self)
+
+    # ###########################################
+    # Document Methods
+
+    @classmethod
+    def get_active_document(cls):
+        return cls.document
+
+    @classmethod
+    def new_document(cls):
+        del cls.document[:]
+        del cls.selection[:]
+        return cls.document
+
+    @classmethod
+    def get_active_view(cls):
+        return None
+
+    @classmethod
+    def refresh_view(cls):
+        pass
+
+    @classmethod
+    def view_all(cls):
+        pass
+
+    @classmethod
+    def view_selected(cls):
+        pass
+
+    # ###########################################
+    # Selection
+
+    @classmethod
+    def clear_selection(cls):
+        del cls.selection[:]
+
+
+
+
+class NumpyForm(BaseForm):
+    def __init__(self):
+        BaseForm.__init__(self)
+        self.error = lambda msg: print("ERROR: " + msg)
+        self.warn = lambda msg: print("WARNING: " + msg)
+        self.log = lambda msg: print("LOG: " + msg)
+        self.message = lambda msg: print("MESSAGE: " + msg)
+
+
+    # ###########################################
+    # Factories
+
+    @classmethod
+    def get_selected(cls):
+        objs = NumpyApp.selection
+        if objs:
+            self = cls()
+            self.obj = objs[0]
+            return self
+        else:
+            return None
+
+    @classmethod
+    def _add(cls, obj):
+        NumpyApp.document.append(obj)
+        self = cls()
+        self.obj = obj
+        return self
+
+    @classmethod
+    def make_line(cls, p1, p2):
+        return cls._add(NumpyCurve('line', [tuple(p1), tuple(p2)],
+                                   name="hyLine"))
+
+    @classmethod
+    def make_circle(cls, r):
+        return cls._add(NumpyCurve('circle', radius=float(r),
+                                   name="hyCircle"))
+
+    @classmethod
+    def make_interpolation_curve(cls, pts):
+        return cls._add(NumpyCurve('bspline', [tuple(pt) for pt in pts]))
+
+    @classmethod
+    def make_random_curve(cls, nPts=4, xr=(0,1), yr=(0,1), zr=(0,0), xsigma=0.5):
+        nPts = int(nPts)
+        if nPts == 0: return None
+        pts = []
+        step = float(xr[1]-xr[0])/nPts
+        for i in range(nPts):
+            pts.append((random.gauss(xr[0]+i*step, xsigma*step),
+                        random.uniform(yr[0],yr[1]),
+                        random.uniform(zr[0],zr[1])))
+        return cls.make_interpolation_curve(pts)
+
+    @classmethod
+    def make_lines(cls, pairs):
+        pairs = numpy.asarray(pairs, dtype=numpy.float64).reshape(-1, 2, 3)
+        return cls._add_many([NumpyCurve('line', pair, name="hyLine")
+                              for pair in pairs])
+
+    @classmethod
+    def make_circles(cls, radii, centers=None):
+        objs = [NumpyCurve('circle', radius=float(r), name="hyCircle")
+                for r in radii]
+        if centers is not None:
+            centers = numpy.asarray(centers, dtype=numpy.float64)
+            for obj, center in zip(objs, centers):
+                obj.matrix[:3, 3] = center
+        return cls._add_many(objs)
+
+    @classmethod
+    def make_interpolation_curves(cls, point_lists):
+        return cls._add_many([NumpyCurve('bspline', pts)
+                              for pts in point_lists])
+
+    @classmethod
+    def _add_many(cls, objs):
+        NumpyApp.document.extend(objs)
+        forms = []
+        for obj in objs:
+            self = cls()
+            self.obj = obj
+            forms.append(self)
+        return forms
+
+
+    # ###########################################
+    # Selection
+
+    def select(self, clear_first=False):
+        if clear_first:
+            NumpyApp.clear_selection()
+        if not self.is_selected():
+            NumpyApp.selection.append(self.obj)
+
+    def unselect(self):
+        if self.is_selected():
+            NumpyApp.selection.remove(self.obj)
+
+    def is_selected(self):
+        return any(obj is self.obj for obj in NumpyApp.selection)
+
+
+    # ###########################################
+    # Geometry Classification
+
+    def is_curve(self):
+        return self._cached('is_curve',
+                            lambda: isinstance(self.obj, NumpyCurve))
+
+    def is_line_curve(self):
+        return self.is_curve() and self.obj.kind == 'line'
+
+    def is_planar_curve(self):
+        if not self.is_curve():
+            return False
+        if self.obj.kind != 'bspline':
+            return True
+        def compute():
+            pts = self.obj.derivatives(self.obj.spans(), 0)[0]
+            if len(pts) < 4:
+                return True
+            sv = numpy.linalg.svd(pts - pts.mean(axis=0), compute_uv=False)
+            return bool(sv[2] <= 1e-9*max(sv[0], 1.0))
+        return self._cached('planar', compute)
+
+    def is_closed_curve(self):
+        if not self.is_curve():
+            return False
+        if self.obj.kind == 'circle':
+            return True
+        def compute():
+            ends = self.obj.derivatives(self.obj.domain, 0)[0]
+            return bool(numpy.allclose(ends[0], ends[1]))
+        return self._cached('closed', compute)
+
+
+    # ###########################################
+    # Curve Methods
+
+    def length(self):
+        if self.is_curve():
+            return self._cached('length', self.obj.length)
+        else:
+            self.error("not a curve")
+            return None
+
+    def bounding_box(self):
+        """Return ((xmin, ymin, zmin), (xmax, ymax, zmax)).
+
+        Taken from a dense sampling, exact for lines.
+        """
+        def compute():
+            spans = self.obj.spans()
+            ts = numpy.concatenate([numpy.linspace(spans[i], spans[i+1], 64)
+                                    for i in range(len(spans)-1)])
+            pts = self.obj.derivatives(ts, 0)[0]
+            return tuple(pts.min(axis=0)), tuple(pts.max(axis=0))
+        return self._cached('bounding_box', compute)
+
+    def value_at(self, t, paramNormalized=True, param=None):
+        if self.is_curve():
+            t = self._param(t, paramNormalized, param)
+            return self.obj.derivatives(t, 0)[0][0]
+        else:
+            self.error("not a curve")
+            return None
+
+    def tangent_at(self, t, paramNormalized=True, param=None):
+        if self.is_curve():
+            t = self._param(t, paramNormalized, param)
+            d1 = self.obj.derivatives(t, 1)[1][0]
+            return d1 / numpy.sqrt(numpy.dot(d1, d1))
+        else:
+            self.error("not a curve")
+            return None
+
+    def curvature_at(self, t, paramNormalized=True, param=None):
+        if self.is_curve():
+            t = self._param(t, paramNormalized, param)
+            d1, d2 = self.obj.derivatives(t, 2)[1:]
+            return float(_curvature(d1, d2)[0])
+        else:
+            self.error("not a curve")
+            return None
+
+    def center_of_curvature_at(self, t, paramNormalized=True, param=None):
+        if self.is_curve():
+            t = self._param(t, paramNormalized, param)
+            p, d1, d2 = self.obj.derivatives(t, 2)
+            k = _curvature(d1, d2)[0]
+            if k == 0.0:
+                return None
+            n = numpy.cross(numpy.cross(d1[0], d2[0]), d1[0])
+            return p[0] + n / (k*numpy.sqrt(numpy.dot(n, n)))
+        else:
+            self.error("not a curve")
+            return None
+
+    def derivative1_at(self, t, paramNormalized=True, param=None):
+        if self.is_curve():
+            t = self._param(t, paramNormalized, param)
+            return self.obj.derivatives(t, 1)[1][0]
+        else:
+            self.error("not a curve")
+            return None
+
+    def derivative2_at(self, t, paramNormalized=True, param=None):
         if self.is_curve():
-            if paramNormalized: t = self._param_from_normalized(t)
-            return self.obj.derivative1At(param)
+            t = self._param(t, paramNormalized, param)
+            return self.obj.derivatives(t, 2)[2][0]
         else:
             self.error("not a curve")
             return None
 
-    def derivative2_at(self, t, paramNormalized=True):
+    def derivative3_at(self, t, paramNormalized=True, param=None):
         if self.is_curve():
-            if paramNormalized: t = self._param_from_normalized(t)
-            return self.obj.derivative2At(param)
+            t = self._param(t, paramNormalized, param)
+            return self.obj.derivatives(t, 3)[3][0]
         else:
             self.error("not a curve")
             return None
 
-    def derivative3_at(self, t, paramNormalized=True):
+    def value_at_many(self, ts, paramNormalized=True, param=None):
+        """Return (N,3) array of points at parameters ts."""
+        return self._derivative_many(0, ts, paramNormalized, param)
+
+    def tangent_at_many(self, ts, paramNormalized=True, param=None):
+        d1 = self._derivative_many(1, ts, paramNormalized, param)
+        if d1 is None: return None
+        return d1 / numpy.sqrt(numpy.sum(d1*d1, axis=1))[:, numpy.newaxis]
+
+    def curvature_at_many(self, ts, paramNormalized=True, param=None):
+        """Return (N,) array of curvatures at parameters ts."""
+        if self.is_curve():
+            ts = _as_params(ts)
+            ts = self._param(ts, paramNormalized, param)
+            d1, d2 = self.obj.derivatives(ts, 2)[1:]
+            return _curvature(d1, d2)
+        else:
+            self.error("not a curve")
+            return None
+
+    def center_of_curvature_at_many(self, ts, paramNormalized=True, param=None):
+        if self.is_curve():
+            ts = _as_params(ts)
+            ts = self._param(ts, paramNormalized, param)
+            p, d1, d2 = self.obj.derivatives(ts, 2)
+            k = _curvature(d1, d2)
+            n = numpy.cross(numpy.cross(d1, d2), d1)
+            nlen = numpy.sqrt(numpy.sum(n*n, axis=1)) * k
+            with numpy.errstate(divide='ignore', invalid='ignore'):
+                return p + n / nlen[:, numpy.newaxis]
+        else:
+            self.error("not a curve")
+            return None
+
+    def derivative1_at_many(self, ts, paramNormalized=True, param=None):
+        return self._derivative_many(1, ts, paramNormalized, param)
+
+    def derivative2_at_many(self, ts, paramNormalized=True, param=None):
+        return self._derivative_many(2, ts, paramNormalized, param)
+
+    def derivative3_at_many(self, ts, paramNormalized=True, param=None):
+        return self._derivative_many(3, ts, paramNormalized, param)
+
+    def _derivative_many(self, order, ts, paramNormalized, param):
         if self.is_curve():
-            if paramNormalized: t = self._param_from_normalized(t)
-            return self.obj.derivative3At(param)
+            ts = _as_params(ts)
+            ts = self._param(ts, paramNormalized, param)
+            return self.obj.derivatives(ts, order)[order]
         else:
             self.error("not a curve")
             return None
 
     def closest_curve_point(self, pt):
+        """Return curve parameter closest to pt."""
         if self.is_curve():
-            return rs.CurveClosestPoint(self.obj, pt)
+            pt = numpy.array(tuple(pt), dtype=numpy.float64)
+            # coarse sampling, then Newton on (C(t)-pt).C'(t) = 0
+            spans = self.obj.spans()
+            ts = numpy.unique(numpy.concatenate(
+                [numpy.linspace(spans[i], spans[i+1], 16)
+                 for i in range(len(spans)-1)]))
+            pts = self.obj.derivatives(ts, 0)[0]
+            t = ts[numpy.argmin(numpy.sum((pts - pt)**2, axis=1))]
+            lo, hi = self.obj.domain
+            for i in range(8):
+                p, d1, d2 = [d[0] for d in self.obj.derivatives(t, 2)]
+                f = numpy.dot(p - pt, d1)
+                df = numpy.dot(d1, d1) + numpy.dot(p - pt, d2)
+                if df <= 0.0:
+                    break
+                t = min(max(t - f/df, lo), hi)
+            return float(t)
         else:
             self.error("not a curve")
             return None
 
-    def tessellate(self, num):
-        """Tessellate curve.
+    def _tessellate(self, num):
+        """Tessellate curve, return (N,3) array.
         num: number of points
-             if <= 1 points with num distance in nomalized t"""
+             if <= 1 points with num distance in nomalized length"""
         if self.is_curve():
             if num <= 1.0:
-                seglen = num*rs.CurveLength(self.obj)
-                return rs.DivideCurveLength(self.obj, seglen)
+                s = numpy.arange(0.0, 1.0 + 1e-9, num)
             else:
-                return rs.DivideCurve(self.obj, num-1)
+                s = numpy.linspace(0.0, 1.0, int(num))
+            return self.value_at_many(s, param='length')
         else:
             self.error("not a curve")
             return None
 
     def _param_from_normalized(self, t):
-        domain = rs.CurveDomain(self.obj)
+        domain = self.obj.domain
         return domain[0] + t*(domain[1]-domain[0])
 
 
     # ###########################################
-    # Surface Methods
+    # Transformations
 
+    def _geometry_key(self):
+        if not isinstance(self.obj, NumpyCurve):
+            return None
+        return (self.obj, self.obj.version)
 
-    # ###########################################
-    # Transformations
+    def _transform(self, mat):
+        # euclid.Matrix4 converts through __array__
+        self.obj.transform(numpy.asarray(mat, dtype=numpy.float64).reshape(4, 4))
 
-    # def transform_shape(self, matrix):
-    #     self.obj.transformShape()
 
-    def transform(self, mat):
-        rs.TransformObject(self.obj, mat.tolist())
+def _curvature(d1, d2):
+    """Curvature |d1 x d2| / |d1|^3 for (N,3) derivative arrays."""
+    cross = numpy.cross(d1, d2)
+    speed = numpy.sqrt(numpy.sum(d1*d1, axis=-1))
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        k = numpy.sqrt(numpy.sum(cross*cross, axis=-1)) / speed**3
+    return numpy.where(speed > 0.0, k, 0.0)
+
 
 
 # ############################################################################
-# Selecting Implementation (FreeCAD or Rhino)
-try:
-    import FreeCAD
-    import Part
-    App = FreeCadApp
-    Form = FreeCadForm
-except ImportError:
+# Selecting Implementation (FreeCAD, Rhino or headless numpy)
+def _detect_backend():
+    """Import the host modules, return 'freecad', 'rhino' or 'numpy'."""
+    global FreeCAD, Part, rhinoscript, rs
+    try:
+        import FreeCAD
+        import Part
+        return 'freecad'
+    except ImportError:
+        pass
     try:
         import rhinoscript
         import rhinoscriptsyntax as rs
-        App = RhinoApp
-        Form = RhinoForm
+        return 'rhino'
     except ImportError:
-        print("Error: wrong context, run in FreeCAD or Rhino")
+        pass
+    if numpy is None:
+        raise ImportError("wrong context, run in FreeCAD or Rhino, "
+                          "or install numpy for headless use")
+    return 'numpy'
+
+# reload(form) keeps the globals, so the failing host imports are probed
+# only once per process
+try:
+    _backend
+except NameError:
+    _backend = _detect_backend()
+
+App, Form = {'freecad': (FreeCadApp, FreeCadForm),
+             'rhino': (RhinoApp, RhinoForm),
+             'numpy': (NumpyApp, NumpyForm)}[_backend]
 
 
 
@@ -727,6 +1834,10 @@ make_line = Form.make_line
 make_circle = Form.make_circle
 make_interpolation_curve = Form.make_interpolation_curve
 make_random_curve = Form.make_random_curve
+make_lines = Form.make_lines
+make_circles = Form.make_circles
+make_interpolation_curves = Form.make_interpolation_curves
+make_random_curves = Form.make_random_curves
 # Transformations
 P = euclid.Point3                           # x, y, z
 V = euclid.Vector3                          # x, y, z
@@ -744,8 +744,20 @@ def decompose_matrix(matrix):
     >>> numpy.allclose(R0, R1)
     True
 
+    For an (..., 4, 4) stack of matrices, the results are stacked too:
+
+    >>> M0 = numpy.array([T0, S, R0])
+    >>> scale, shear, angles, trans, persp = decompose_matrix(M0)
+    >>> angles.shape
+    (3, 3)
+    >>> numpy.allclose(R0, euler_matrix(*angles[2]))
+    True
+
     """
-    M = numpy.array(matrix, dtype=numpy.float64, copy=True).T
+    M = numpy.array(matrix, dtype=numpy.float64, copy=True)
+    if M.ndim > 2:
+        return _decompose_matrix_many(M)
+    M = M.T
     if abs(M[3, 3]) < _EPS:
         raise ValueError("M[3, 3] is zero")
     M /= M[3, 3]
@@ -799,6 +811,63 @@ def decompose_matrix(matrix):
     return scale, shear, angles, translate, perspective
 
 
+def _decompose_matrix_many(M):
+    """Return decompose_matrix for an (..., 4, 4) stack of matrices."""
+    M = numpy.swapaxes(M, -1, -2)
+    if numpy.any(numpy.abs(M[..., 3, 3]) < _EPS):
+        raise ValueError("M[3, 3] is zero")
+    M /= M[..., 3:, 3:]
+    P = M.copy()
+    P[..., :, 3] = 0.0, 0.0, 0.0, 1.0
+    if not numpy.all(numpy.linalg.det(P)):
+        raise ValueError("matrix is singular")
+
+    perspective = numpy.zeros(M.shape[:-1])
+    perspective[..., 3] = 1.0
+    persp = numpy.any(numpy.abs(M[..., :3, 3]) > _EPS, axis=-1)
+    if numpy.any(persp):
+        # v . inv(P.T) solves P x = v
+        perspective[persp] = numpy.linalg.solve(
+            P[persp], M[persp][..., :, 3:])[..., 0]
+
+    translate = M[..., 3, :3].copy()
+
+    row = M[..., :3, :3].copy()
+    row0, row1, row2 = row[..., 0, :], row[..., 1, :], row[..., 2, :]
+    dot = lambda a, b: numpy.sum(a * b, axis=-1)[..., numpy.newaxis]
+    scale = numpy.zeros(M.shape[:-2] + (3, ))
+    shear = numpy.zeros(M.shape[:-2] + (3, ))
+    scale[..., 0] = vector_norm(row0, axis=-1)
+    row0 /= scale[..., 0:1]
+    shear[..., 0:1] = dot(row0, row1)
+    row1 -= row0 * shear[..., 0:1]
+    scale[..., 1] = vector_norm(row1, axis=-1)
+    row1 /= scale[..., 1:2]
+    shear[..., 0] /= scale[..., 1]
+    shear[..., 1:2] = dot(row0, row2)
+    row2 -= row0 * shear[..., 1:2]
+    shear[..., 2:3] = dot(row1, row2)
+    row2 -= row1 * shear[..., 2:3]
+    scale[..., 2] = vector_norm(row2, axis=-1)
+    row2 /= scale[..., 2:3]
+    shear[..., 1:] /= scale[..., 2:3]
+
+    flip = dot(row0, numpy.cross(row1, row2))[..., 0] < 0
+    scale[flip] *= -1.0
+    row[flip] *= -1.0
+
+    angles = numpy.zeros(M.shape[:-2] + (3, ))
+    angles[..., 1] = numpy.arcsin(numpy.clip(-row[..., 0, 2], -1.0, 1.0))
+    lock = numpy.cos(angles[..., 1]) == 0.0
+    angles[..., 0] = numpy.where(
+        lock, numpy.arctan2(-row[..., 2, 1], row[..., 1, 1]),
+        numpy.arctan2(row[..., 1, 2], row[..., 2, 2]))
+    angles[..., 2] = numpy.where(
+        lock, 0.0, numpy.arctan2(row[..., 0, 1], row[..., 0, 0]))
+
+    return scale, shear, angles, translate, perspective
+
+
 def compose_matrix(scale=None, shear=None, angles=None, translate=None,
                    perspective=None):
     """Return transformation matrix from sequence of transformations.
@@ -823,7 +892,20 @@ def compose_matrix(scale=None, shear=None, angles=None, translate=None,
     >>> is_same_transform(M0, M1)
     True
 
+    The factors may be (..., 3) and (..., 4) arrays, which are broadcast
+    against each other and give an (..., 4, 4) stack of matrices:
+
+    >>> M0 = numpy.array([M0, M1, numpy.identity(4)])
+    >>> M1 = compose_matrix(*decompose_matrix(M0))
+    >>> M1.shape
+    (3, 4, 4)
+    >>> all(is_same_transform(a, b) for a, b in zip(M0, M1))
+    True
+
     """
+    factors = scale, shear, angles, translate, perspective
+    if any(numpy.ndim(f) > 1 for f in factors if f is not None):
+        return _compose_matrix_many(*factors)
     M = numpy.identity(4)
     if perspective is not None:
         P = numpy.identity(4)
@@ -852,6 +934,50 @@ def compose_matrix(scale=None, shear=None, angles=None, translate=None,
     return M
 
 
+def _compose_matrix_many(scale, shear, angles, translate, perspective):
+    """Return compose_matrix for stacks of factors."""
+    shape = numpy.broadcast(*[numpy.empty(numpy.shape(f)[:-1])
+                              for f in (scale, shear, angles, translate,
+                                        perspective, 0.0)
+                              if f is not None]).shape
+
+    def identity():
+        I = numpy.zeros(shape + (4, 4))
+        I[..., [0, 1, 2, 3], [0, 1, 2, 3]] = 1.0
+        return I
+
+    M = identity()
+    if perspective is not None:
+        P = identity()
+        P[..., 3, :] = numpy.asarray(perspective)[..., :4]
+        M = numpy.matmul(M, P)
+    if translate is not None:
+        T = identity()
+        T[..., :3, 3] = numpy.asarray(translate)[..., :3]
+        M = numpy.matmul(M, T)
+    if angles is not None:
+        angles = numpy.asarray(angles)
+        R = euler_matrix(angles[..., 0], angles[..., 1], angles[..., 2],
+                         'sxyz')
+        M = numpy.matmul(M, R)
+    if shear is not None:
+        shear = numpy.asarray(shear)
+        Z = identity()
+        Z[..., 1, 2] = shear[..., 2]
+        Z[..., 0, 2] = shear[..., 1]
+        Z[..., 0, 1] = shear[..., 0]
+        M = numpy.matmul(M, Z)
+    if scale is not None:
+        scale = numpy.asarray(scale)
+        S = identity()
+        S[..., 0, 0] = scale[..., 0]
+        S[..., 1, 1] = scale[..., 1]
+        S[..., 2, 2] = scale[..., 2]
+        M = numpy.matmul(M, S)
+    M /= M[..., 3:, 3:]
+    return M
+
+
 def orthogonalization_matrix(lengths, angles):
     """Return orthogonalization matrix for crystallographic cell coordinates.
 
@@ -1057,6 +1183,16 @@ def euler_matrix(ai, aj, ak, axes='sxyz'):
     >>> for axes in _TUPLE2AXES.keys():
     ...    R = euler_matrix(ai, aj, ak, axes)
 
+    The angles may be arrays, e.g. the columns of an (N,3) array, in which
+    case a stack of matrices is returned:
+
+    >>> angles = (4*math.pi) * (numpy.random.random((5, 3)) - 0.5)
+    >>> R = euler_matrix(*angles.T, axes='rzxz')
+    >>> R.shape
+    (5, 4, 4)
+    >>> numpy.allclose(R[2], euler_matrix(axes='rzxz', *angles[2]))
+    True
+
     """
     try:
         firstaxis, parity, repetition, frame = _AXES2TUPLE[axes]
@@ -1068,6 +1204,10 @@ def euler_matrix(ai, aj, ak, axes='sxyz'):
     j = _NEXT_AXIS[i+parity]
     k = _NEXT_AXIS[i-parity+1]
 
+    if numpy.ndim(ai) or numpy.ndim(aj) or numpy.ndim(ak):
+        return _euler_matrix_many(ai, aj, ak, i, j, k,
+                                  parity, repetition, frame)
+
     if frame:
         ai, ak = ak, ai
     if parity:
@@ -1102,6 +1242,45 @@ def euler_matrix(ai, aj, ak, axes='sxyz'):
     return M
 
 
+def _euler_matrix_many(ai, aj, ak, i, j, k, parity, repetition, frame):
+    """Return euler_matrix for broadcast arrays of angles."""
+    ai, aj, ak = numpy.broadcast_arrays(
+        *[numpy.asarray(a, dtype=numpy.float64) for a in (ai, aj, ak)])
+    if frame:
+        ai, ak = ak, ai
+    if parity:
+        ai, aj, ak = -ai, -aj, -ak
+
+    si, sj, sk = numpy.sin(ai), numpy.sin(aj), numpy.sin(ak)
+    ci, cj, ck = numpy.cos(ai), numpy.cos(aj), numpy.cos(ak)
+    cc, cs = ci*ck, ci*sk
+    sc, ss = si*ck, si*sk
+
+    M = numpy.zeros(ai.shape + (4, 4))
+    M[..., 3, 3] = 1.0
+    if repetition:
+        M[..., i, i] = cj
+        M[..., i, j] = sj*si
+        M[..., i, k] = sj*ci
+        M[..., j, i] = sj*sk
+        M[..., j, j] = -cj*ss+cc
+        M[..., j, k] = -cj*cs-sc
+        M[..., k, i] = -sj*ck
+        M[..., k, j] = cj*sc+cs
+        M[..., k, k] = cj*cc-ss
+    else:
+        M[..., i, i] = cj*ck
+        M[..., i, j] = sj*sc-cs
+        M[..., i, k] = sj*cc+ss
+        M[..., j, i] = cj*sk
+        M[..., j, j] = sj*ss+cc
+        M[..., j, k] = sj*cs-sc
+        M[..., k, i] = -sj
+        M[..., k, j] = cj*si
+        M[..., k, k] = cj*ci
+    return M
+
+
 def euler_from_matrix(matrix, axes='sxyz'):
     """Return Euler angles from rotation matrix for specified axis sequence.
 
@@ -1120,6 +1299,16 @@ def euler_from_matrix(matrix, axes='sxyz'):
     ...    R1 = euler_matrix(axes=axes, *euler_from_matrix(R0, axes))
     ...    if not numpy.allclose(R0, R1): print(axes, "failed")
 
+    For a stack of matrices, arrays of angles are returned. The second
+    matrix is in gimbal lock:
+
+    >>> R0 = euler_matrix([.1, .2, .3], [.5, 0., 1.5], [.3, .2, .1], 'rzxz')
+    >>> al, be, ga = euler_from_matrix(R0, 'rzxz')
+    >>> al.shape
+    (3,)
+    >>> numpy.allclose(R0, euler_matrix(al, be, ga, 'rzxz'))
+    True
+
     """
     try:
         firstaxis, parity, repetition, frame = _AXES2TUPLE[axes.lower()]
@@ -1131,7 +1320,10 @@ def euler_from_matrix(matrix, axes='sxyz'):
     j = _NEXT_AXIS[i+parity]
     k = _NEXT_AXIS[i-parity+1]
 
-    M = numpy.array(matrix, dtype=numpy.float64, copy=False)[:3, :3]
+    M = numpy.array(matrix, dtype=numpy.float64, copy=False)
+    if M.ndim > 2:
+        return _euler_from_matrix_many(M, i, j, k, parity, repetition, frame)
+    M = M[:3, :3]
     if repetition:
         sy = math.sqrt(M[i, j]*M[i, j] + M[i, k]*M[i, k])
         if sy > _EPS:
@@ -1160,6 +1352,31 @@ def euler_from_matrix(matrix, axes='sxyz'):
     return ax, ay, az
 
 
+def _euler_from_matrix_many(M, i, j, k, parity, repetition, frame):
+    """Return euler_from_matrix for a (..., 4, 4) stack of matrices."""
+    atan2 = numpy.arctan2
+    if repetition:
+        sy = numpy.sqrt(M[..., i, j]*M[..., i, j] + M[..., i, k]*M[..., i, k])
+        lock = sy <= _EPS
+        ax = numpy.where(lock, atan2(-M[..., j, k],  M[..., j, j]),
+                               atan2( M[..., i, j],  M[..., i, k]))
+        ay = atan2(sy, M[..., i, i])
+        az = numpy.where(lock, 0.0, atan2(M[..., j, i], -M[..., k, i]))
+    else:
+        cy = numpy.sqrt(M[..., i, i]*M[..., i, i] + M[..., j, i]*M[..., j, i])
+        lock = cy <= _EPS
+        ax = numpy.where(lock, atan2(-M[..., j, k],  M[..., j, j]),
+                               atan2( M[..., k, j],  M[..., k, k]))
+        ay = atan2(-M[..., k, i], cy)
+        az = numpy.where(lock, 0.0, atan2(M[..., j, i], M[..., i, i]))
+
+    if parity:
+        ax, ay, az = -ax, -ay, -az
+    if frame:
+        ax, az = az, ax
+    return ax, ay, az
+
+
 def euler_from_quaternion(quaternion, axes='sxyz'):
     """Return Euler angles from quaternion for specified axis sequence.
 
@@ -1257,8 +1474,16 @@ def quaternion_matrix(quaternion):
     >>> numpy.allclose(M, numpy.diag([1, -1, -1, 1]))
     True
 
+    An (..., 4) stack of quaternions gives an (..., 4, 4) stack of matrices:
+
+    >>> M = quaternion_matrix([[1, 0, 0, 0], [0, 1, 0, 0]])
+    >>> numpy.allclose(M, [numpy.identity(4), numpy.diag([1, -1, -1, 1])])
+    True
+
     """
     q = numpy.array(quaternion, dtype=numpy.float64, copy=True)
+    if q.ndim > 1:
+        return _quaternion_matrix_many(q)
     n = numpy.dot(q, q)
     if n < _EPS:
         return numpy.identity(4)
@@ -1271,6 +1496,27 @@ def quaternion_matrix(quaternion):
         [                0.0,                 0.0,                 0.0, 1.0]])
 
 
+def _quaternion_matrix_many(q):
+    """Return quaternion_matrix for an (..., 4) stack of quaternions."""
+    n = numpy.sum(q*q, axis=-1)
+    small = n < _EPS
+    q *= numpy.sqrt(2.0 / numpy.where(small, 1.0, n))[..., numpy.newaxis]
+    w, x, y, z = numpy.moveaxis(q, -1, 0)
+    M = numpy.zeros(q.shape[:-1] + (4, 4))
+    M[..., 0, 0] = 1.0-y*y-z*z
+    M[..., 0, 1] = x*y-z*w
+    M[..., 0, 2] = x*z+y*w
+    M[..., 1, 0] = x*y+z*w
+    M[..., 1, 1] = 1.0-x*x-z*z
+    M[..., 1, 2] = y*z-x*w
+    M[..., 2, 0] = x*z-y*w
+    M[..., 2, 1] = y*z+x*w
+    M[..., 2, 2] = 1.0-x*x-y*y
+    M[..., 3, 3] = 1.0
+    M[small] = numpy.identity(4)
+    return M
+
+
 def quaternion_from_matrix(matrix, isprecise=False):
     """Return quaternion from rotation matrix.
 
@@ -1301,9 +1547,27 @@ def quaternion_from_matrix(matrix, isprecise=False):
     >>> q = quaternion_from_matrix(R)
     >>> is_same_transform(R, quaternion_matrix(q))
     True
+    >>> R = rotation_matrix(3.0, (1, 0, 0))
+    >>> q = quaternion_from_matrix(R, True)
+    >>> numpy.allclose(q, quaternion_from_matrix(R))
+    True
+
+    An (..., 4, 4) stack of matrices gives an (..., 4) stack of quaternions:
+
+    >>> R = numpy.array([random_rotation_matrix() for i in range(10)])
+    >>> q = quaternion_from_matrix(R)
+    >>> q.shape
+    (10, 4)
+    >>> numpy.allclose(quaternion_matrix(q), R)
+    True
+    >>> numpy.allclose(quaternion_from_matrix(R, True), q)
+    True
 
     """
-    M = numpy.array(matrix, dtype=numpy.float64, copy=False)[:4, :4]
+    M = numpy.array(matrix, dtype=numpy.float64, copy=False)
+    if M.ndim > 2:
+        return _quaternion_from_matrix_many(M[..., :4, :4], isprecise)
+    M = M[:4, :4]
     if isprecise:
         q = numpy.empty((4, ))
         t = numpy.trace(M)
@@ -1313,16 +1577,17 @@ def quaternion_from_matrix(matrix, isprecise=False):
             q[2] = M[0, 2] - M[2, 0]
             q[1] = M[2, 1] - M[1, 2]
         else:
-            i, j, k = 1, 2, 3
+            i, j, k = 0, 1, 2
             if M[1, 1] > M[0, 0]:
-                i, j, k = 2, 3, 1
+                i, j, k = 1, 2, 0
             if M[2, 2] > M[i, i]:
-                i, j, k = 3, 1, 2
+                i, j, k = 2, 0, 1
             t = M[i, i] - (M[j, j] + M[k, k]) + M[3, 3]
             q[i] = t
             q[j] = M[i, j] + M[j, i]
             q[k] = M[k, i] + M[i, k]
             q[3] = M[k, j] - M[j, k]
+            q = q[[3, 0, 1, 2]]
         q *= 0.5 / math.sqrt(t * M[3, 3])
     else:
         m00 = M[0, 0]
@@ -1348,6 +1613,57 @@ def quaternion_from_matrix(matrix, isprecise=False):
     return q
 
 
+def _quaternion_from_matrix_many(M, isprecise):
+    """Return quaternion_from_matrix for an (..., 4, 4) stack of matrices."""
+    shape = M.shape[:-2]
+    M = M.reshape(-1, 4, 4)
+    n = numpy.arange(len(M))
+    if isprecise:
+        # the branches of the scalar code, evaluated for all matrices
+        case = (M[:, 1, 1] > M[:, 0, 0]).astype(numpy.intp)
+        case[M[:, 2, 2] > M[n, case, case]] = 2
+        case += 1
+        t = numpy.trace(M, axis1=1, axis2=2)
+        case[t > M[:, 3, 3]] = 0
+        q = numpy.empty((len(M), 4))
+        trace = case == 0
+        m = M[trace]
+        q[trace] = numpy.stack((t[trace],
+                                m[:, 2, 1] - m[:, 1, 2],
+                                m[:, 0, 2] - m[:, 2, 0],
+                                m[:, 1, 0] - m[:, 0, 1]), axis=-1)
+        for i, j, k in ((0, 1, 2), (1, 2, 0), (2, 0, 1)):
+            sel = case == i + 1
+            m = M[sel]
+            t[sel] = m[:, i, i] - (m[:, j, j] + m[:, k, k]) + m[:, 3, 3]
+            qs = numpy.empty((len(m), 4))
+            qs[:, i+1] = t[sel]
+            qs[:, j+1] = m[:, i, j] + m[:, j, i]
+            qs[:, k+1] = m[:, k, i] + m[:, i, k]
+            qs[:, 0] = m[:, k, j] - m[:, j, k]
+            q[sel] = qs
+        q *= (0.5 / numpy.sqrt(t * M[:, 3, 3]))[:, numpy.newaxis]
+    else:
+        # symmetric matrices K, lower triangles
+        K = numpy.zeros((len(M), 4, 4))
+        K[:, 0, 0] = M[:, 0, 0]-M[:, 1, 1]-M[:, 2, 2]
+        K[:, 1, 0] = M[:, 0, 1]+M[:, 1, 0]
+        K[:, 1, 1] = M[:, 1, 1]-M[:, 0, 0]-M[:, 2, 2]
+        K[:, 2, 0] = M[:, 0, 2]+M[:, 2, 0]
+        K[:, 2, 1] = M[:, 1, 2]+M[:, 2, 1]
+        K[:, 2, 2] = M[:, 2, 2]-M[:, 0, 0]-M[:, 1, 1]
+        K[:, 3, 0] = M[:, 2, 1]-M[:, 1, 2]
+        K[:, 3, 1] = M[:, 0, 2]-M[:, 2, 0]
+        K[:, 3, 2] = M[:, 1, 0]-M[:, 0, 1]
+        K[:, 3, 3] = M[:, 0, 0]+M[:, 1, 1]+M[:, 2, 2]
+        K /= 3.0
+        # quaternions are eigenvectors of K for the largest eigenvalues
+        w, V = numpy.linalg.eigh(K)
+        q = V[n, :, numpy.argmax(w, axis=-1)][:, [3, 0, 1, 2]]
+    q[q[:, 0] < 0.0] *= -1.0
+    return q.reshape(shape + (4, ))
+
+
 def quaternion_multiply(quaternion1, quaternion0):
     """Return multiplication of two quaternions.
 
@@ -1429,7 +1745,25 @@ def quaternion_slerp(quat0, quat1, fraction, spin=0, shortestpath=True):
         numpy.allclose(2, math.acos(-numpy.dot(q0, q1)) / angle)
     True
 
+    Quaternions may be given as (..., 4) stacks and fraction as an array,
+    they are broadcast against each other:
+
+    >>> f = numpy.linspace(0.0, 1.0, 11)
+    >>> q = quaternion_slerp(q0, q1, f)
+    >>> q.shape
+    (11, 4)
+    >>> numpy.allclose(q[5], quaternion_slerp(q0, q1, 0.5))
+    True
+    >>> q = quaternion_slerp([q0, q1], [q1, q0], [0.0, 1.0])
+    >>> numpy.allclose(q, [q0, q0])
+    True
+
     """
+    fraction = numpy.asarray(fraction)
+    if numpy.ndim(quat0) > 1 or numpy.ndim(quat1) > 1 or fraction.ndim:
+        return _quaternion_slerp_many(quat0, quat1, fraction, spin,
+                                      shortestpath)
+    fraction = float(fraction)
     q0 = unit_vector(quat0[:4])
     q1 = unit_vector(quat1[:4])
     if fraction == 0.0:
@@ -1453,6 +1787,30 @@ def quaternion_slerp(quat0, quat1, fraction, spin=0, shortestpath=True):
     return q0
 
 
+def _quaternion_slerp_many(quat0, quat1, fraction, spin, shortestpath):
+    """Return quaternion_slerp element-wise over broadcast stacks."""
+    q0 = unit_vector(numpy.array(quat0, dtype=numpy.float64)[..., :4], axis=-1)
+    q1 = unit_vector(numpy.array(quat1, dtype=numpy.float64)[..., :4], axis=-1)
+    fraction = numpy.asarray(fraction, dtype=numpy.float64)[..., numpy.newaxis]
+    d = numpy.sum(q0 * q1, axis=-1)[..., numpy.newaxis]
+    keep0 = numpy.abs(numpy.abs(d) - 1.0) < _EPS
+    q1_end = q1
+    if shortestpath:
+        # invert rotation
+        q1 = numpy.where(d < 0.0, -q1, q1)
+        d = numpy.abs(d)
+    angle = numpy.arccos(numpy.clip(d, -1.0, 1.0)) + \
+        numpy.asarray(spin)[..., numpy.newaxis] * math.pi
+    keep0 = keep0 | (numpy.abs(angle) < _EPS)
+    angle = numpy.where(keep0, 1.0, angle)
+    isin = 1.0 / numpy.sin(angle)
+    q = q0 * (numpy.sin((1.0 - fraction) * angle) * isin) + \
+        q1 * (numpy.sin(fraction * angle) * isin)
+    q = numpy.where(keep0, q0, q)
+    q = numpy.where(fraction == 1.0, q1_end, q)
+    return numpy.where(fraction == 0.0, q0, q)
+
+
 def random_quaternion(rand=None):
     """Return uniform random unit quaternion.
 